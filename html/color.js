@@ -0,0 +1,29 @@
+// Used by the colour pages (output/*color.html): follows the page's colour as
+// it is pushed by the scoreboard's server, so the page never reloads. Without
+// the server (e.g. a change made from the command line while the program isn't
+// running), the page is reloaded every few seconds to get its written colour.
+(function () {
+  const script = document.currentScript;
+  const name = location.pathname.split("/").pop().replace(/color\.html$/, "");
+  const server = location.protocol.startsWith("http") ? "" : script.dataset.server;
+
+  let reload = null;
+  const source = new EventSource(server + "/events/colors");
+  function update(e) {
+    const colors = JSON.parse(e.data);
+    if (name in colors) {
+      document.body.style.backgroundColor = colors[name] || "";
+    }
+  }
+  source.addEventListener("state", update);
+  source.addEventListener("patch", update);  // Only the changed colours.
+  source.addEventListener("open", () => {
+    clearTimeout(reload);
+    reload = null;
+  });
+  source.addEventListener("error", () => {
+    if (reload === null) {
+      reload = setTimeout(() => location.reload(), 5000);
+    }
+  });
+})();
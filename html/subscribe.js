@@ -0,0 +1,54 @@
+// Shared by the overlays: calls update(state) whenever the named state changes.
+// "save" is the full saved state (save.json), "live" is the much smaller
+// summary of the live teams and map (output/live.json).
+//
+// When the overlay is served by the scoreboard (http://127.0.0.1:8331/html/),
+// the full state is pushed once on connection, followed by JSON merge patches
+// (RFC 7386) as changes are saved. Opened as a local file, there is no server,
+// so the file is polled every `interval` milliseconds instead.
+
+const FILES = {
+  save: "../save.json",
+  live: "../output/live.json",
+};
+
+function mergePatch(target, patch) {
+  if (patch === null || typeof patch !== "object" || Array.isArray(patch)) {
+    return patch;
+  }
+  if (target === null || typeof target !== "object" || Array.isArray(target)) {
+    target = {};
+  }
+  for (let key of Object.keys(patch)) {
+    if (patch[key] === null) {
+      delete target[key];
+    } else {
+      target[key] = mergePatch(target[key], patch[key]);
+    }
+  }
+  return target;
+}
+
+function subscribe(update, interval, name = "save") {
+  if (window.EventSource && location.protocol.startsWith("http")) {
+    let state = null;
+    let source = new EventSource("/events/" + name);
+    source.addEventListener("state", (e) => {
+      state = JSON.parse(e.data);
+      update(state);
+    });
+    source.addEventListener("patch", (e) => {
+      state = mergePatch(state, JSON.parse(e.data));
+      update(state);
+    });
+    // EventSource reconnects by itself, and receives the full state again.
+  } else {
+    function poll() {
+      $.getJSON(FILES[name]).done(update).fail((err) => {
+        console.log(err);
+      });
+    }
+    poll();
+    setInterval(poll, interval);
+  }
+}
@@ -0,0 +1,90 @@
+import argparse
+import logging
+import os
+import sys
+
+from . import output
+from .constants import OUTPUTROOT, SAVEFILE
+from .engine import operations
+from .engine.state import State
+
+
+# Command line interface for scripts and bracket tools, for example
+#     python -m scoreboard.cli score 2 1 3
+# sets team 1's score on map 2 to 3. The saved state is loaded, changed and
+# saved again, and only the outputs affected by the change are written. Kivy
+# is not used, so it starts quickly. Don't use it while the scoreboard is
+# running, the program would overwrite the change when it next saves.
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m scoreboard.cli",
+        description="Change the scoreboard and update its output files.")
+    parser.add_argument("--save", default=SAVEFILE,
+                        help="save file (default: %(default)s)")
+    commands = parser.add_subparsers(dest="op", metavar="command")
+    commands.required = True  # Python 3.6 has no required argument.
+
+    command = commands.add_parser("score", help="set a team's map score")
+    command.add_argument("map", type=int, help="map number")
+    command.add_argument("team", type=int, help="team number (1 or 2)")
+    command.add_argument("score")
+
+    command = commands.add_parser("final", help="mark a map final")
+    command.add_argument("map", type=int, help="map number")
+    command.add_argument("--undo", dest="final", action="store_false",
+                         help="mark the map not final")
+
+    command = commands.add_parser("current", help="set the current map")
+    command.add_argument("map", type=int, nargs="?",
+                         help="map number (none or 0 for no current map)")
+
+    command = commands.add_parser("move", help="move a map to a position")
+    command.add_argument("map", type=int, help="map number")
+    command.add_argument("position", type=int,
+                         help="new map number (later maps move down)")
+
+    commands.add_parser("swap", help="swap the live teams and scores")
+
+    command = commands.add_parser("team", help="select a live team")
+    command.add_argument("team", type=int, help="team number (1 or 2)")
+    command.add_argument("name", help="team name (\"\" for no team)")
+
+    command = commands.add_parser("hero", help="set a live player's hero")
+    command.add_argument("team", type=int, help="team number (1 or 2)")
+    command.add_argument("player", type=int, help="player number (1 to 6)")
+    command.add_argument("hero", help="hero name (\"\" for no hero)")
+
+    command = commands.add_parser("custom", help="set a custom text file")
+    command.add_argument("file", help="filename, e.g. caster1.txt")
+    command.add_argument("data")
+
+    commands.add_parser("refresh",
+                        help="rescan the images and redraw all outputs")
+
+    return parser
+
+
+def main(argv=None):
+    parser = make_parser()
+    args = vars(parser.parse_args(argv))
+    file = args.pop("save")
+    operation = operations.OPERATIONS[args.pop("op")]
+
+    # Kivy would otherwise set up the logger (see engine/common.py).
+    logging.basicConfig(format="%(levelname)s: %(message)s")
+    os.makedirs(OUTPUTROOT + "/custom", exist_ok=True)
+
+    state = State.from_save(file)
+    try:
+        with output.transaction():
+            operation(state, **args)  # Arguments are validated first.
+            state.write(file)
+            state.draw_summary()
+    except ValueError as e:
+        parser.exit(1, "{}: error: {}\n".format(parser.prog, e))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -1,67 +1,49 @@
 import os
-import re
 
 from kivy.lang import Builder
-from kivy.logger import Logger
 from kivy.uix.popup import Popup
 from kivy.uix.boxlayout import BoxLayout
 
-from ..constants import OUTPUTROOT
+from .. import output
 # NOTE: helpers also loads a kv file for widgets used.
-from ..helpers import LoadableWidget, filename_fmt, text_fmt
+from ..helpers import LoadableWidget
 
 
 Builder.load_file(os.path.dirname(os.path.abspath(__file__)) + "/custom.kv")
 
 
 class CustomDataManager(LoadableWidget, BoxLayout):
+    # View of the engine.custom models, which hold the data and do the output.
+
     @classmethod
-    def from_factory(cls, entries=None, **kwargs):
+    def from_factory(cls, model, **kwargs):
         self = super().from_factory(**kwargs)
 
-        if entries is None:
-            # This means this is first-run and has not been used before.
-            # Can't use blank list as that can be in saved state.
-            entries = ["caster1.txt", "caster2.txt",
-                       "analyst1.txt", "analyst2.txt", ]
-            # Create "instances" (kwargs for constructor) for each file.
-            # Leave the data undefined; it defaults anyway.
-            entries = [{'file': i} for i in entries]
-
-        for child in entries:
-            self.add_entry(**child)
-        self.clean()  # No point drawing here as child.draw() bypasses.
+        self.model = model
+        self.model.sync(self)
+        self.draw()
 
         return self
 
-    @property
-    def files(self):
-        # Return list as we use "if a in files".
-        return [child.file.text for child in self.entries.children]
-
+    @output.batched
     def add_entry(self, **data):
-        # Instantiate from args - widget inherits LoadableWidget self-adding.
-        CustomTextWidget.from_factory(**data,
-                                      parent=self.entries, manager=self)
+        self.model.addentry(**data)  # Fires "entries", causing a redraw.
 
     def add_new(self):
         FilenameDialog(self).open()  # Popup asking for filename.
 
-    def clean(self):
-        files = self.files
+    def callback_event(self, event):
+        if event == "entries":
+            self.draw()
 
-        for f in os.listdir(OUTPUTROOT + "/custom"):
-            if f not in files:
-                os.remove(OUTPUTROOT + "/custom/" + f)
-
-    def save(self):
-        self.manager.save()
+    def draw(self):
+        for child in self.entries.children:
+            child.model.desync(child)
+        self.entries.clear_widgets()
 
-    def __export__(self):
-        return {
-            'entries': [i.__export__() for i in
-                        reversed(self.entries.children)],
-        }
+        for entry in self.model.entries:
+            CustomTextWidget.from_factory(model=entry,
+                                          parent=self.entries, manager=self)
 
 
 class CustomTextWidget(LoadableWidget, BoxLayout):
@@ -69,71 +51,34 @@ class CustomTextWidget(LoadableWidget, BoxLayout):
         super().__init__(*args, **kwargs)
 
         # Workaround for Kivy #3588 TextInput on_text fired on init.
-        self.instantiation_complete = False
+        self.model = None
 
     @classmethod
-    def from_factory(cls, file="", data="", **kwargs):
+    def from_factory(cls, model, **kwargs):
         self = super().from_factory(**kwargs)
 
-        file = filename_fmt(file)
-        if not file:
-            # I know I'm bad at naming files, but really? No name at all?
-            Logger.warning("Custom: Empty filename, defaulting.")
-            file = "untitled.txt"  # Default
-
-        # Workaround for Kivy #3588 TextInput on_text fired on init.
-        self.instantiation_complete = True
-
-        # Check for a duplicate filename and rename this one accordingly.
-        # Basically Untitled.txt => Untitled_2.txt => Untitled_3.txt and so on.
-        files = self.manager.files
-        if file in files:
-            # The filename is known, this is a problem.
-            file = file.rsplit(".", 1)
-
-            # Check if it has a number on the end or not, and prep new number.
-            end = re.search(r"(?<=_)\d+$", file[0])
-            if end:
-                end = end.group()
-                file[0] = file[0][:-len(end)]
-                end = int(end)
-            else:
-                if not file[0].endswith("_"):
-                    file[0] += "_"
-                end = 1  # Increments to 2 immediately.
-
-            while True:
-                end += 1  # Increment the number until we get a free file.
-                new = [file[0] + str(end)] + file[1:]
-                new = ".".join(new)
-                if new not in files:
-                    break
-
-            file = new
-
-        self.file.text = file
-        self.data.text = data  # Triggers draw by change (unless blank).
-        self.draw()  # Force draw anyway, in case file out of sync.
+        self.model = model
+        self.model.sync(self)
+        self.draw()
 
         return self
 
+    @output.batched
+    def callback_data(self, value):
+        if self.model is not None:
+            self.model.data = value  # Fires "data" if changed, which outputs.
+
+    @output.batched
     def callback_delete(self):
-        self.parent.remove_widget(self)
-        self.manager.save()
-        self.manager.clean()  # Cleanup.
+        self.model.manager.removeentry(self.model)  # Fires "entries".
+
+    def callback_event(self, event):
+        if event == "data":
+            self.draw()
 
     def draw(self):
-        if self.instantiation_complete:
-            # Workaround for Kivy #3588 TextInput on_text fired on init.
-            with open(OUTPUTROOT + "/custom/" + self.file.text, 'w') as f:
-                f.write(text_fmt(self.data.text))
-            self.manager.save()
-
-    def __export__(self):
-        return {
-            'file': self.file.text,
-            'data': self.data.text,
-        }
+        self.file.text = self.model.file
+        self.data.text = self.model.data
 
 
 class FilenameDialog(Popup):
@@ -1,8 +1,60 @@
+from .engine.common import filename_fmt
+
+
 IMAGEROOT = "assets"
 OUTPUTROOT = "output"
 SAVEFILE = "save.json"
 
-# For all heroes, use sorted(sum(HEROES.values(), [])).
+# How image outputs are made from the images (and team logos): "copy",
+# "hardlink", "symlink" or "reflink" (a copy-on-write clone, on Linux
+# filesystems such as Btrfs and XFS). Linking makes switching images instant
+# even for large files, but hard links and symlinks keep the image's own
+# modification time, and OBS only reloads an image whose time changed (see
+# README.md). If the filesystem refuses (e.g. the output folder is on another
+# drive), the image is copied instead.
+OUTPUTLINK = "copy"
+
+# Team logos are scaled down (and padded to a square) to these sizes, which
+# are cached in LOGOCACHE by their contents. Needs Pillow, otherwise logos are
+# output as they are.
+LOGOSIZES = (128, 256, 512)
+LOGOCACHE = "cache/logos"
+
+# Effects on the images of maps that aren't current, and on their mode images:
+# "desat" (greyscale), "dim", both (e.g. "desat dim") or "" for none. A
+# "<style> <effect>" folder of hand-made images (e.g. assets/maps/strips desat)
+# is used if there is one; otherwise they are generated (needs Pillow) and
+# cached in EFFECTCACHE.
+MAPEFFECT = "desat"
+POOLEFFECT = ""
+EFFECTCACHE = "cache/effects"
+
+# Saves are coalesced: written once input has been quiet for SAVEDELAY seconds,
+# but never more than SAVELATENCY seconds after the first unsaved change.
+SAVEDELAY = 0.5
+SAVELATENCY = 2.0
+
+# Local server for overlays (html/), which pushes state changes to them.
+SERVERHOST = "127.0.0.1"
+SERVERPORT = 8331
+
+# Colour pages (output/*color.html) either follow colour changes pushed by the
+# server ("push"), or reload themselves every second ("refresh").
+COLORPAGES = "push"
+
+# Image styles, the folders in IMAGEROOT/heroes and IMAGEROOT/maps.
+HEROSTYLES = ('3D', 'Icons', 'Portraits')
+MAPSTYLES = ('Icons', 'Strips')
+
+ROLES = ('Damage', 'Tank', 'Support', 'Flex')
+
+# Blank team SRs are calculated from the SRs entered in the roster (players
+# without one are left out): "mean", "top6" (mean of the 6 highest), "median"
+# or "weighted" (a mean where each SR counts as much as its rank from the
+# lowest, so higher SRs count more).
+TEAMSR = "mean"
+
+# All heroes are in ALLHEROES, see the lookup tables below.
 HEROES = {
     'Damage': [
         'Ashe',
@@ -130,4 +182,27 @@ MAPS['Elimination'] += MAPS['Capture the Flag']  # Update after Deathmatch.
 
 del MAPS['extendedcontrol']  # Must not appear in the dropdown.
 for k, v in MAPS.items():
-    MAPS[k] = [""] + sorted(v)  # Sort the lists, add blank option.
+    MAPS[k] = ("",) + tuple(sorted(v))  # Sort the lists, add blank option.
+
+# Lookup tables, built once rather than on every redraw. The lists above are
+# tuples from here on, so they can't be changed by accident.
+for k, v in HEROES.items():
+    HEROES[k] = tuple(sorted(v))
+ALLHEROES = tuple(sorted(hero for v in HEROES.values() for hero in v))
+POOLS = tuple(MAPS)  # In dropdown order.
+
+# Reverse indexes: the role of each hero, and the pools of each map.
+HEROROLES = {hero: role for role, v in HEROES.items() for hero in v}
+MAPPOOLS = {}
+for k, v in MAPS.items():
+    for map in v[1:]:  # Skip the blank option.
+        MAPPOOLS[map] = MAPPOOLS.get(map, ()) + (k,)
+
+# Image filenames (without ".png") of every hero, map, pool, role and style,
+# as made by filename_fmt. Includes the "_pool <pool>" images of map pools.
+FILENAMES = {
+    name: filename_fmt(name) for name in (
+        ALLHEROES + tuple(MAPPOOLS) + POOLS + ROLES + HEROSTYLES + MAPSTYLES
+        + tuple("_pool " + pool for pool in POOLS))
+}
+del k, v, map
@@ -0,0 +1,172 @@
+from collections import Counter
+from contextlib import suppress
+from functools import partial
+import os
+
+from .. import output
+from ..constants import (ALLHEROES, FILENAMES, HEROSTYLES, IMAGEROOT,
+                         MAPEFFECT, MAPS, MAPSTYLES, POOLEFFECT, POOLS, ROLES)
+from . import effects
+from .common import Logger, filename_fmt
+
+# Folders of each kind of image in IMAGEROOT, and whether they have a
+# subfolder per style (e.g. heroes/portraits/ana.png, game/roles/tank.png).
+KINDS = {
+    'heroes': ("heroes", True),
+    'maps': ("maps", True),
+    'modes': ("game/modes", False),
+    'roles': ("game/roles", False),
+    'positions': ("game/positions", False),
+}
+
+# Paths of the images in IMAGEROOT by (kind, style, name), with style and name
+# as formatted by filename() (style is None for kinds without styles). The
+# folders are scanned once, rather than trying (and failing) to copy missing
+# images on every draw. Call refresh() after adding or removing images.
+_index = None
+_missing = None  # Path of the placeholder for missing images, if it exists.
+
+
+def refresh():
+    global _index, _missing
+    index = {}
+    for kind, (folder, styled) in KINDS.items():
+        folder = "{}/{}".format(IMAGEROOT, folder)
+        if styled:
+            for style in _listdir(folder):
+                if style.is_dir():
+                    _scan(index, kind, style.name.lower(), style.path)
+        else:
+            _scan(index, kind, None, folder)
+    _index = index
+
+    _missing = IMAGEROOT + "/missing.png"
+    if not os.path.isfile(_missing):
+        _missing = None
+    report()
+
+
+def _listdir(folder):
+    with suppress(FileNotFoundError, NotADirectoryError):
+        return list(os.scandir(folder))
+    return []
+
+
+def _scan(index, kind, style, folder):
+    for entry in _listdir(folder):
+        name, extension = os.path.splitext(entry.name)
+        if extension.lower() == ".png" and entry.is_file():
+            index[kind, style, name.lower()] = entry.path
+
+
+def filename(name):
+    # Image filename (without extension) of a hero, map etc. The known names
+    # are formatted once, in FILENAMES.
+    try:
+        return FILENAMES[name]
+    except KeyError:
+        return filename_fmt(name)
+
+
+def expected():
+    # (kind, style, name) of every image the scoreboard may need.
+    for style in HEROSTYLES:
+        for hero in ALLHEROES:
+            yield "heroes", style, hero
+
+    for style in MAPSTYLES:
+        for pool, maps in MAPS.items():
+            yield "maps", style, "_pool " + pool  # Map not selected.
+            for map in maps:
+                if map:
+                    yield "maps", style, map
+
+    for pool in POOLS:
+        yield "modes", None, pool
+    for role in ROLES:
+        yield "roles", None, role
+    for position in ("attack", "defense"):
+        yield "positions", None, position
+
+
+def report():
+    # Log all missing images at once, rather than a warning for every draw.
+    if not os.path.isdir(IMAGEROOT):
+        Logger.warning("Assets: No {} folder, images are missing".format(
+            IMAGEROOT))
+        return
+
+    missing = set()
+    for kind, style, name in expected():
+        if find(kind, name, style) is None:
+            folder = KINDS[kind][0]
+            if style is not None:
+                folder += "/" + filename(style)
+            missing.add((folder, filename(name)))
+
+    if missing:
+        folders = Counter(folder for folder, name in missing)
+        Logger.warning("Assets: {} images missing ({})".format(
+            len(missing), ", ".join("{} {}".format(*item)
+                                    for item in sorted(folders.items()))))
+        Logger.debug("Assets: Missing " + ", ".join(
+            "{}/{}.png".format(*item) for item in sorted(missing)))
+    else:
+        Logger.info("Assets: All images found")
+
+
+def find(kind, name, style=None):
+    # Path of an image, or None if there's no such image.
+    if _index is None:
+        refresh()
+    if style is not None:
+        style = filename(style)
+    return _index.get((kind, style, filename(name)))
+
+
+def draw(target, kind, name, style=None, placeholder=False, effect=""):
+    # Copy an image to target, with effect (see MAPEFFECT) applied. If there's
+    # no such image, target is removed, or replaced by the "missing" image if
+    # placeholder is set.
+    path = None
+    if effect and style is not None:
+        # Hand-made images, in a "<style> <effect>" folder, come first.
+        path = find(kind, name, "{} {}".format(style, effect))
+    if path is None:
+        path = find(kind, name, style)
+        if path is not None and effect:
+            # Applied when copied (in the output writer, if started).
+            path = partial(effects.apply, path, effect)
+
+    if path is None and placeholder:
+        path = _missing
+        if path is None:
+            output.write(target, b"")  # Empty file as a last resort.
+            return
+
+    if path is None:
+        output.remove(target)
+    else:
+        # Falls back as above if the image was removed since the scan.
+        output.copyfile(path, target, delete_if_missing=not placeholder)
+
+
+def prewarm(mapstyle=None):
+    # Apply the effects to all map (and mode) images in the background, those
+    # of mapstyle first, so switching maps or styles doesn't wait for them.
+    if _index is None:
+        refresh()
+
+    styles = [filename(style) for style in MAPSTYLES]
+    if mapstyle is not None:
+        styles.insert(0, filename(mapstyle))
+
+    jobs = []
+    for (kind, style, name), path in _index.items():
+        if kind == "maps" and MAPEFFECT and style in styles:
+            if find(kind, name, "{} {}".format(style, MAPEFFECT)) is None:
+                jobs.append((styles.index(style), path, MAPEFFECT))
+        elif kind == "modes" and POOLEFFECT:
+            jobs.append((0, path, POOLEFFECT))
+    jobs.sort(key=lambda job: job[0])
+    effects.prewarm([job[1:] for job in jobs])
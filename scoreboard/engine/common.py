@@ -0,0 +1,107 @@
+from contextlib import suppress
+from functools import lru_cache
+import logging
+import re
+import time
+import unicodedata
+
+
+# Shared by the models (engine) and widgets; this module must not use Kivy.
+
+
+# This is the logger behind kivy.logger.Logger; using it directly means the
+# engine and output can log without importing (and initialising) Kivy.
+Logger = logging.getLogger("kivy")
+
+
+class Synchronisable:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.listeners = []
+
+    def sync(self, listener):
+        self.listeners.append(listener)
+
+    def desync(self, listener):
+        # Get the right-index of the object in case added multiple times.
+        # This allows sync/desync to act as a stack, and maintain call order.
+        with suppress(ValueError):
+            rindex = -1 - list(reversed(self.listeners)).index(listener)
+            self.listeners.pop(rindex)
+
+    def callback_event(self, event):
+        for listener in self.listeners:
+            listener.callback_event(event)
+
+
+_MISSING = object()  # Sentinel for attributes which haven't been set yet.
+
+
+class Property:
+    # Model attribute which fires owner.callback_event(event) when changed,
+    # similar to a TextInput's on_text. The event defaults to the attribute
+    # name. The first assignment (in __init__) initialises it silently.
+    def __init__(self, event=None):
+        self.event = event
+
+    def __set_name__(self, owner, name):
+        self.name = name
+        if self.event is None:
+            self.event = name
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        return obj.__dict__[self.name]
+
+    def __set__(self, obj, value):
+        old = obj.__dict__.get(self.name, _MISSING)
+        obj.__dict__[self.name] = value
+        if old is not _MISSING and old != value:
+            obj.callback_event(self.event)
+
+
+class Timer:
+    # Breakdown of where time goes, e.g. on startup: call lap(name) after
+    # each step, str() gives the total and each step in milliseconds.
+    def __init__(self):
+        self.start = self.last = time.perf_counter()
+        self.laps = []
+
+    def lap(self, name):
+        now = time.perf_counter()
+        self.laps.append((name, now - self.last))
+        self.last = now
+
+    def __str__(self):
+        laps = ", ".join("{} {:.0f}".format(name, seconds * 1000)
+                         for name, seconds in self.laps)
+        return "{:.0f} ms ({})".format((self.last - self.start) * 1000, laps)
+
+
+# The formatters are called with the same few names (heroes, maps, teams...)
+# on every draw, so their results are cached, up to FORMATCACHE each. The
+# constants module can't be imported here, it uses filename_fmt.
+FORMATCACHE = 1024
+
+# Allow letters (including underscores), spaces, dots and hyphens (dashes).
+_UNSAFE = re.compile(r"[^\w .-]", flags=re.ASCII)
+
+
+@lru_cache(maxsize=FORMATCACHE)
+def filename_fmt(val):
+    val = unicodedata.normalize('NFD', val)  # Normalise, then strip others.
+    val = str(bytes(val, encoding='ascii', errors='ignore'), encoding='ascii')
+    val = val.lower()
+    return _UNSAFE.sub("", val)
+
+
+@lru_cache(maxsize=FORMATCACHE, typed=True)  # Don't mix up 1 and True.
+def text_fmt(val):
+    return str(val).upper()
+
+
+def formatstats():
+    # Hits, misses and size of the formatter caches, e.g. for /api/output.
+    return {function.__name__: function.cache_info()._asdict()
+            for function in (filename_fmt, text_fmt)}
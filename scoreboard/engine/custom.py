@@ -0,0 +1,120 @@
+import re
+
+from .. import output
+from ..constants import OUTPUTROOT
+from .common import (Logger, Property, Synchronisable, filename_fmt,
+                     text_fmt)
+
+
+class Custom(Synchronisable):
+    # Custom text files (output/custom). callback_event fires "entries" when
+    # entries are added or deleted.
+
+    def __init__(self, entries=None, manager=None):
+        super().__init__()
+        self.manager = manager
+
+        if entries is None:
+            # This means this is first-run and has not been used before.
+            # Can't use blank list as that can be in saved state.
+            entries = ["caster1.txt", "caster2.txt",
+                       "analyst1.txt", "analyst2.txt", ]
+            # Create "instances" (kwargs for constructor) for each file.
+            # Leave the data undefined; it defaults anyway.
+            entries = [{'file': i} for i in entries]
+
+        self.entries = []
+        for data in entries:
+            self.entries.append(self.makeentry(**data))
+
+    @property
+    def files(self):
+        # Return list as we use "if a in files".
+        return [entry.file for entry in self.entries]
+
+    def makeentry(self, file="", data=""):
+        file = filename_fmt(file)
+        if not file:
+            # I know I'm bad at naming files, but really? No name at all?
+            Logger.warning("Custom: Empty filename, defaulting.")
+            file = "untitled.txt"  # Default
+
+        # Check for a duplicate filename and rename this one accordingly.
+        # Basically Untitled.txt => Untitled_2.txt => Untitled_3.txt and so on.
+        files = self.files
+        if file in files:
+            # The filename is known, this is a problem.
+            file = file.rsplit(".", 1)
+
+            # Check if it has a number on the end or not, and prep new number.
+            end = re.search(r"(?<=_)\d+$", file[0])
+            if end:
+                end = end.group()
+                file[0] = file[0][:-len(end)]
+                end = int(end)
+            else:
+                if not file[0].endswith("_"):
+                    file[0] += "_"
+                end = 1  # Increments to 2 immediately.
+
+            while True:
+                end += 1  # Increment the number until we get a free file.
+                new = [file[0] + str(end)] + file[1:]
+                new = ".".join(new)
+                if new not in files:
+                    break
+
+            file = new
+
+        return CustomText(file=file, data=data, manager=self)
+
+    def addentry(self, **data):
+        entry = self.makeentry(**data)
+        self.entries.append(entry)
+        entry.draw()
+        self.save()
+        self.callback_event("entries")
+        return entry
+
+    def removeentry(self, entry):
+        self.entries.remove(entry)
+        self.save()
+        output.release("custom/" + entry.file)
+        self.callback_event("entries")
+
+    def draw(self):
+        for entry in self.entries:
+            entry.draw()
+
+    def save(self):
+        self.manager.save()
+
+    def __export__(self):
+        return {
+            'entries': [i.__export__() for i in self.entries],
+        }
+
+
+class CustomText(Synchronisable):
+    # callback_event fires "data" when the text changed.
+    data = Property()
+
+    def __init__(self, file, data="", manager=None):
+        super().__init__()
+        self.manager = manager
+        self.file = file  # Fixed, a unique (formatted) filename.
+        self.data = data
+
+    def callback_event(self, event):
+        self.draw()
+        self.manager.save()
+        super().callback_event(event)
+
+    def draw(self):
+        output.write(OUTPUTROOT + "/custom/" + self.file, text_fmt(self.data))
+
+    def __export__(self):
+        return {
+            'file': self.file,
+            'data': self.data,
+        }
@@ -0,0 +1,100 @@
+from contextlib import suppress
+import hashlib
+import os
+import threading
+import time
+
+from ..constants import EFFECTCACHE
+from .common import Logger
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None  # Images are used without effects.
+
+DIMMING = 0.5  # Brightness of "dim" images.
+
+
+def _desat(image):
+    return image.convert("LA").convert("RGBA")  # Keeps transparency.
+
+
+def _dim(image):
+    alpha = image.getchannel("A")
+    image = image.point(lambda value: int(value * DIMMING))
+    image.putalpha(alpha)
+    return image
+
+
+EFFECTS = {
+    'desat': _desat,
+    'dim': _dim,
+}
+
+# Images with effects applied are cached in EFFECTCACHE, named by the hash of
+# the source image's path, its modification time and the effect. This maps
+# those to the cached image, so it is only checked for once.
+_cache = {}
+
+
+def _make(path, effect, file):
+    with Image.open(path) as image:
+        image = image.convert("RGBA")
+    for name in effect.split():
+        image = EFFECTS[name](image)
+
+    # Renamed when done, see output._replace(). The name is unique to the
+    # thread, as prewarm() may be making the same image.
+    temp = "{}.{}.tmp".format(file, threading.get_ident())
+    try:
+        image.save(temp, "PNG")
+        os.replace(temp, file)
+    except BaseException:
+        with suppress(FileNotFoundError):
+            os.remove(temp)
+        raise
+
+
+def apply(path, effect):
+    # Path of the image with effect applied, or the image itself if it can't
+    # be (no effect, no Pillow, or the image can't be read).
+    if not effect or Image is None:
+        return path
+
+    try:
+        key = (os.path.abspath(path), os.stat(path).st_mtime_ns, effect)
+        file = _cache.get(key)
+        if file is None:
+            digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+            file = "{}/{}.png".format(EFFECTCACHE, digest)
+            if not os.path.isfile(file):
+                os.makedirs(EFFECTCACHE, exist_ok=True)
+                _make(path, effect, file)
+            _cache[key] = file
+    except FileNotFoundError:
+        return path  # Dealt with when it is output.
+    except KeyError as e:
+        Logger.warning("Effects: Unknown effect {}".format(e))
+        return path
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        Logger.warning("Effects: Can't apply {} to {}: {}".format(
+            effect, path, e))
+        return path
+    return file
+
+
+def prewarm(jobs):
+    # Apply effects to (path, effect) pairs in a background thread, so they
+    # are ready when needed. The cache persists, so this is quick after the
+    # first run.
+    if Image is None:
+        return
+
+    def run():
+        start = time.perf_counter()
+        for path, effect in jobs:
+            apply(path, effect)
+        Logger.info("Effects: Prepared {} images in {:.0f} ms".format(
+            len(jobs), (time.perf_counter() - start) * 1000))
+
+    threading.Thread(target=run, name="prewarm", daemon=True).start()
@@ -0,0 +1,319 @@
+import itertools
+
+from .. import output
+from ..constants import ALLHEROES, HEROES, OUTPUTROOT
+from . import logos
+from .common import Property, Synchronisable
+from .teams import Team
+
+
+class Live(Synchronisable):
+    # The Live tab: broadcast title, hero settings and the two live teams.
+    # callback_event fires the name of a changed property, "swap" when the
+    # teams are swapped, and "teamchange" when a live team (or its details)
+    # changed, which affects the map and match results.
+    title = Property()
+    herostyle = Property()
+    herofilter = Property()
+
+    def __init__(self, title="", herostyle="Portraits", herofilter=True,
+                 team1={}, team2={}, manager=None):
+        super().__init__()
+        self.manager = manager
+
+        self.title = title
+        self.herostyle = herostyle
+        self.herofilter = herofilter
+
+        self.teams = manager.teams
+        self.teams.sync(self)  # Listen for changes of the selectable teams.
+
+        self.teamset = [LiveTeam(**team1, index1=1, manager=self),
+                        LiveTeam(**team2, index1=2, manager=self)]
+
+    @property
+    def teamlist(self):
+        # The selectable teams, maintained by the Teams model (name: Team).
+        return self.teams.teamlist
+
+    def swap(self):
+        # Both assignments redraw their team; the swap event swaps scores.
+        a, b = self.teamset
+        a.team, b.team = b.team, a.team
+        self.callback_event("swap")
+
+    def callback_event(self, event):
+        if event == "teamset":
+            for team in self.teamset:
+                team.callback_teamset()
+            return
+        elif event == "teams":
+            return  # Teams added or deleted, handled by "teamset" if relevant.
+
+        if event == "title":
+            self.draw_title()
+        elif event == "herostyle":
+            for team in self.teamset:
+                team.draw_heroes()
+        if event in ("title", "herostyle", "herofilter"):
+            self.save()
+        super().callback_event(event)  # Propagate to listeners (maps, view).
+
+    def draw_title(self):
+        output.write(OUTPUTROOT + "/livetitle.txt", self.title)
+
+    def draw(self):
+        self.draw_title()
+        for team in self.teamset:
+            team.draw()
+
+    def save(self):
+        self.manager.save()
+
+    def __export__(self):
+        return {
+            'title': self.title,
+            'herofilter': self.herofilter,
+            'herostyle': self.herostyle,
+            'team1': self.teamset[0].__export__(),
+            'team2': self.teamset[1].__export__(),
+        }
+
+    def export_live(self):
+        # Resolved teams for the live state summary (live.json).
+        return {
+            'title': self.title,
+            'team1': self.teamset[0].export_live(),
+            'team2': self.teamset[1].export_live(),
+        }
+
+
+class LiveTeam(Synchronisable):
+    # A live team position, showing the selected Team (or none). callback_event
+    # fires "team" when another team is selected, "teamset" when the
+    # selectable teams changed, and the events of the selected Team.
+    # Class member as opposed to instance memeber since it's constant.
+    PROPERTIES = ("name", "logo", "color", "sr")
+
+    def __init__(self, name="", index1=1, manager=None):
+        super().__init__()
+        self.manager = manager
+        self.index1 = index1  # Team number, used in output filenames.
+
+        # Unknown names (e.g. a renamed team in an edited save) select none.
+        self._team = manager.teamlist.get(name)
+        if self._team is not None:
+            self._team.sync(self)
+
+        players = self.teamroster
+        self.players = [LivePlayer(player=next(players), index1=i + 1,
+                                   manager=self)
+                        for i in range(6)]
+
+    @property
+    def team(self):
+        return self._team
+
+    @team.setter
+    def team(self, team):
+        if team is self._team:
+            return
+
+        if self._team is not None:
+            self._team.desync(self)
+        if team is not None:
+            team.sync(self)
+        self._team = team
+
+        for property in self.PROPERTIES:
+            self.draw_property(property)
+        self.draw_roster()
+        self.manager.callback_event("teamchange")
+        self.manager.save()
+        super().callback_event("team")  # Notify listeners only.
+
+    @property
+    def name(self):
+        # Name of the selected team, as listed in the team selector.
+        if self.team is None:
+            return ""
+        return self.team.name
+
+    @property
+    def teamroster(self):
+        # An iterator of self.team's Players, followed by repeating None.
+        players = itertools.repeat(None)
+        if self.team is not None:
+            players = itertools.chain(self.team.players, players)
+
+        return players
+
+    def select(self, name):
+        # Select a team by name. KeyError if there's no such (selectable) team.
+        if name != self.name:
+            self.team = self.manager.teamlist[name]
+
+    def callback_teamset(self):
+        # Deselect our team if it can no longer be selected (deleted, renamed
+        # to blank, or hidden by another team of the same name).
+        if (self.team is not None and
+                self.manager.teamlist.get(self.team.name) is not self.team):
+            self.team = None
+        super().callback_event("teamset")
+
+    def callback_event(self, event):
+        # Events of the selected Team.
+        if event in self.PROPERTIES:
+            if event != "sr":
+                # Simulate a teamchange to redraw map/match results.
+                self.manager.callback_event("teamchange")
+            self.draw_property(event)
+        elif event == "roster":
+            self.draw_roster()
+        super().callback_event(event)
+
+    def draw_property(self, property):
+        # name, logo, color, sr
+        if property not in self.PROPERTIES:
+            # If not str then this is gonna throw a TypeError trying to add.
+            raise ValueError("Unknown property: " + property)
+
+        # The extension is txt by default but we need to specify when it's not.
+        extensions = {"logo": "png", "color": "html"}
+        target = "{}/team{}{}.{}".format(OUTPUTROOT, self.index1, property,
+                                         extensions.get(property, "txt"))
+        if self.team is not None:
+            call = getattr(self.team, "draw_" + property)
+            call(target)
+        elif property == "color":
+            # Maintain the refresh rate by putting an html file with no body.
+            Team.make_color(target)
+        else:
+            output.remove(target)
+
+    def draw_roster(self):
+        # Assign players to the slots, which redraw if their player changed.
+        # Slots without a player are "inert" (no outputs).
+        players = self.teamroster
+        for slot in self.players:
+            slot.player = next(players)
+
+    def draw_heroes(self):
+        for slot in self.players:
+            slot.draw_property("hero")
+
+    def draw(self):
+        for property in self.PROPERTIES:
+            self.draw_property(property)
+        self.draw_roster()
+        for slot in self.players:
+            slot.draw()
+
+    def __export__(self):
+        return {
+            'name': self.name,
+        }
+
+    def export_live(self):
+        if self.team is None:
+            return None
+        return {
+            'name': self.team.name,
+            'logo': logos.cached(self.team.logo),  # Scaled for overlays.
+            'color': self.team.teamcolor,
+            'sr': str(self.team.teamsr),
+            'roster': [i.export_live() for i in self.players],
+        }
+
+
+class LivePlayer(Synchronisable):
+    # A player slot of a LiveTeam. callback_event fires "player" when the slot
+    # gets another player, and the events of the player ("battletag" becomes
+    # "user", the name of the output).
+    PROPERTIES = ("user", "role", "sr", "hero")
+
+    def __init__(self, player=None, index1=1, manager=None):
+        super().__init__()
+        self.manager = manager
+        self.index1 = index1  # Player number, used in output filenames.
+
+        self._player = player
+        if player is not None:
+            player.sync(self)
+
+    @property
+    def player(self):
+        return self._player
+
+    @player.setter
+    def player(self, player):
+        if player is self._player:
+            return
+
+        if self._player is not None:
+            self._player.desync(self)
+        if player is not None:
+            player.sync(self)
+        self._player = player
+
+        self.draw()
+        super().callback_event("player")  # Notify listeners only.
+
+    @property
+    def heroes(self):
+        # The heroes which can be selected for this player.
+        if self.player is None:
+            return ()
+
+        filter = None
+        if self.manager.manager.herofilter:
+            filter = self.player.role
+
+        # Flex isn't a defined role and gets all the heroes (no filter).
+        # If the filter switch is off, we also get all heroes. Both are sorted.
+        return ("",) + HEROES.get(filter, ALLHEROES)  # Add blank option.
+
+    def callback_event(self, event):
+        # Events of the player.
+        if event == "battletag":
+            event = "user"
+
+        if event in self.PROPERTIES:
+            self.draw_property(event)
+        super().callback_event(event)
+
+    def draw_property(self, property):
+        if property not in self.PROPERTIES:
+            # If not str then this is gonna throw a TypeError trying to add.
+            raise ValueError("Unknown property: " + property)
+
+        # The extension is txt by default but we need to specify when it's not.
+        extensions = {"role": "png", "hero": "png"}
+        target = "{}/team{}player{}{}.{}".format(
+            # E.g. team1player1user.txt (team number, player number, property).
+            OUTPUTROOT, self.manager.index1, self.index1, property,
+            extensions.get(property, "txt"))
+
+        if self.player is not None:
+            call = getattr(self.player, "draw_" + property)
+
+            # Pass additional arguments as necessary.
+            kwargs = {}
+            if property == "hero":
+                kwargs["style"] = self.manager.manager.herostyle
+            call(target, **kwargs)
+
+        else:
+            output.remove(target)
+
+    def draw(self):
+        for property in self.PROPERTIES:
+            self.draw_property(property)
+
+    def export_live(self):
+        if self.player is None:
+            return None
+        return {
+            **self.player.__export__(),
+            'user': self.player.user,
+        }
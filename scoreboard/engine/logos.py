@@ -0,0 +1,114 @@
+from contextlib import suppress
+from functools import partial
+import hashlib
+import os
+import threading
+
+from ..constants import LOGOCACHE, LOGOSIZES
+from .common import Logger
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None  # Logos are used as they are.
+
+# Team logos are arbitrary user files (often huge), so they are scaled to each
+# of LOGOSIZES when first drawn (by the output writer), and the outputs use
+# those. The variants are named by the hash of the logo's contents, so they
+# are reused after a restart, and by teams sharing a logo.
+_hashes = {}  # Content hash by (path, mtime, size) of the logo file.
+_ready = set()  # Hashes of logos with all variants in the cache.
+_failed = set()  # (path, mtime, size) of logos that can't be scaled.
+
+
+def _key(path):
+    # Changes with the logo's contents, see _hashes.
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+
+def _hash(key):
+    digest = _hashes.get(key)
+    if digest is None:
+        digest = hashlib.sha1()
+        with open(key[0], 'rb') as f:
+            for chunk in iter(partial(f.read, 1 << 20), b""):
+                digest.update(chunk)
+        digest = _hashes[key] = digest.hexdigest()
+    return digest
+
+
+def _cachefile(digest, size):
+    return "{}/{}-{}.png".format(LOGOCACHE, digest, size)
+
+
+def _scale(image, size, file):
+    # Scale to fit (never up), centred on a transparent square.
+    image = image.copy()
+    image.thumbnail((size, size), Image.LANCZOS)
+    square = Image.new("RGBA", (size, size))
+    square.paste(image, ((size - image.width) // 2,
+                         (size - image.height) // 2))
+
+    # Renamed when done, see output._replace(). Logos may be scaled by the
+    # output writer and the live summary at once.
+    temp = "{}.{}.tmp".format(file, threading.get_ident())
+    try:
+        square.save(temp, "PNG")
+        os.replace(temp, file)
+    except BaseException:
+        with suppress(FileNotFoundError):
+            os.remove(temp)
+        raise
+
+
+def prepare(path):
+    # Make the variants of a logo that aren't cached yet. Returns whether they
+    # can be used (False without Pillow, or if the logo can't be read).
+    if Image is None or not path:
+        return False
+
+    key = None
+    try:
+        key = _key(path)
+        if key in _failed:
+            return False  # Warned already, until the logo is changed.
+        digest = _hash(key)
+        if digest in _ready:
+            return True
+
+        missing = [size for size in LOGOSIZES
+                   if not os.path.isfile(_cachefile(digest, size))]
+        if missing:
+            os.makedirs(LOGOCACHE, exist_ok=True)
+            with Image.open(path) as image:
+                image = image.convert("RGBA")
+                for size in missing:
+                    _scale(image, size, _cachefile(digest, size))
+    except FileNotFoundError:
+        return False  # No need to warn, the output is removed.
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        Logger.warning("Logos: Can't scale {}: {}".format(path, e))
+        if key is not None:
+            _failed.add(key)
+        return False
+
+    _ready.add(digest)
+    return True
+
+
+def cached(path, size=LOGOSIZES[-1]):
+    # Like variant(), but never reads or scales the logo (e.g. on the UI
+    # thread): the logo itself until the output writer has scaled it.
+    with suppress(OSError):
+        digest = _hashes.get(_key(path))
+        if digest in _ready:
+            return _cachefile(digest, size)
+    return path
+
+
+def variant(path, size=LOGOSIZES[-1]):
+    # Path of the logo scaled to size (one of LOGOSIZES), or the logo itself.
+    if prepare(path):
+        return _cachefile(_hash(_key(path)), size)
+    return path
@@ -0,0 +1,509 @@
+from contextlib import suppress
+
+from .. import output
+from ..constants import LOGOSIZES, MAPEFFECT, OUTPUTROOT, POOLEFFECT
+from . import assets
+from .common import Logger, Property, Synchronisable, text_fmt
+from .teams import Team, cleancolors
+
+
+# Winner logos are shown next to results, smaller than the live team logos.
+WINNERLOGOSIZE = LOGOSIZES[1]
+
+
+class Maps(Synchronisable):
+    # The map set. callback_event fires the name of a changed property, and
+    # "mapset" when maps are added, deleted or moved.
+    attackers = Property()
+    mapstyle = Property()
+
+    def __init__(self, attackers="", mapstyle="Strips", mapset=[],
+                 current=None, manager=None):
+        super().__init__()
+        self.manager = manager
+
+        self.attackers = attackers
+        self.mapstyle = mapstyle
+        self.mapset = [Map(**data, manager=self) for data in mapset]
+        self.renumber()
+
+        # The current map is saved as its position counted from the last map
+        # (the widgets were a stack), the export function sets it accordingly.
+        self.current = None
+        if current is not None:
+            self.current = self.mapset[-1 - current]
+
+        # Maps won by each team, kept up to date by the maps (callback_winner).
+        self._totals = [0] * 3
+        for map in self.mapset:
+            self._totals[map.winner] += 1
+
+        self.live = manager.live
+        self.live.sync(self)  # Listen for teams/swap events.
+
+    @property
+    def style(self):
+        return self.mapstyle
+
+    @property
+    def totals(self):
+        # Maps won by each team; index 0 counts draws and incomplete maps.
+        return list(self._totals)
+
+    @property
+    def winner(self):
+        # Number of the match-winning team, or 0 if there's no clear winner.
+        teams = self._totals[1:]  # Remove draws.
+        best = max(teams)
+        if teams.count(best) == 1:
+            return teams.index(best) + 1  # 1-indexed.
+        return 0
+
+    def liveteam(self, team):
+        # The Team selected as live team 1 or 2, if any.
+        if team:
+            return self.live.teamset[team - 1].team
+        return None
+
+    def addmap(self, **data):
+        map = Map(**data, manager=self)
+        self.mapset.append(map)
+        map.index1 = len(self.mapset)
+        self._totals[map.winner] += 1
+        map.draw()
+        if map.winner:
+            self.draw_result()
+        self.autocurrentmap()
+        self.save()
+        super().callback_event("mapset")
+        return map
+
+    def removemap(self, map):
+        if self.current is map:
+            self.current = None  # No redraw, the map's outputs are removed.
+        del self.mapset[map.index1 - 1]
+        self.renumber(map.index1 - 1)
+        self._totals[map.winner] -= 1
+        self.autocurrentmap()
+        for i in self.mapset[map.index1 - 1:]:
+            i.draw()  # Later maps are renumbered.
+        self.draw_live()
+        output.release("map{}".format(len(self.mapset) + 1))  # Last one.
+        cleancolors()
+        self.save()
+        super().callback_event("mapset")
+
+    def movemap(self, map, index1):
+        # Move a map to the 1-indexed position index1 (e.g. reorder a series).
+        old = map.index1
+        if old == index1:
+            return
+        self.mapset.insert(index1 - 1, self.mapset.pop(old - 1))
+        start, stop = min(old, index1) - 1, max(old, index1)
+        self.renumber(start, stop)
+        for i in self.mapset[start:stop]:
+            i.draw()  # Only the maps in between are renumbered.
+        # The current map (if any) stays current, at its new position.
+        self.save()
+        super().callback_event("mapset")
+
+    def renumber(self, start=0, stop=None):
+        # Update index1 of the maps in mapset[start:stop] after they moved.
+        for index1, map in enumerate(self.mapset[start:stop], start + 1):
+            map.index1 = index1
+
+    def setcurrentmap(self, map):
+        Logger.debug("Maps: Setting map {} current (was {})".format(
+            map.index1 if map is not None else "empty",
+            self.current.index1 if self.current is not None else "empty"))
+
+        if map is not None and map.final:
+            # A map can't be both current and final (this may set another map
+            # current, which is immediately corrected below).
+            map.final = False
+
+        if self.current is map:
+            return  # Skip superfluous redraws.
+
+        old, self.current = self.current, map
+        for i in (old, map):
+            if i is not None:
+                i.callback_event("current")  # Redraws the map (effects).
+        self.draw_live()  # Must always be called; maps won't trigger it.
+
+    def autocurrentmap(self):
+        # The first non-final map will be the current one.
+        for map in self.mapset:
+            if not map.final:
+                self.setcurrentmap(map)
+                return
+        self.setcurrentmap(None)
+
+    def swapteams(self):
+        for map in self.mapset:
+            map.swapteams()  # Swap map scores.
+
+        # Swap the attackers value. Use existing if lookup fails (no change).
+        # This also applies if there's no currently attacking team (no switch).
+        swap = {"Team 1": "Team 2", "Team 2": "Team 1"}
+        with suppress(KeyError):
+            # EAFP means .get() is NOT preferred here.
+            self.attackers = swap[self.attackers]
+
+    def callback_event(self, event):
+        # Events of our properties, and of Live (which we listen to).
+        if event == "swap":
+            self.swapteams()
+        elif event == "teamchange":
+            # Only results with a winner show the live teams.
+            for map in self.mapset:
+                if map.winner:
+                    map.draw_result()
+            self.draw_result()
+        elif event in ("attackers", "mapstyle"):
+            if event == "attackers":
+                self.draw_positions()
+            else:
+                for map in self.mapset:
+                    map.draw_map()
+                # draw_livemap is called from map.draw_map() unless no current.
+                if self.current is None:
+                    self.draw_livemap()
+            self.save()
+            super().callback_event(event)
+
+    def draw_livepool(self):
+        prefix = "{}/livemappool.".format(OUTPUTROOT)
+        targets = ["png", "txt"]  # Suffixes.
+        if self.current is not None:
+            self.current.draw_pool(prefix, *targets)
+        else:
+            for i in targets:
+                output.remove(prefix + i)
+
+    def draw_livemap(self):
+        prefix = "{}/livemap.".format(OUTPUTROOT)
+        targets = ["png", "txt"]  # Suffixes.
+        if self.current is not None:
+            self.current.draw_map(prefix, *targets)
+        else:
+            for i in targets:
+                output.remove(prefix + i)
+
+    def draw_livescore(self, team=None):
+        if team is None:
+            for team in (1, 2):
+                self.draw_livescore(team)  # Draw for all teams.
+            return
+
+        # Formatted target becomes a format string accepting team only.
+        target = "{}/livemapscore{{team}}.txt".format(OUTPUTROOT)
+        if self.current is not None:
+            self.current.draw_score(team=team, target=target)
+        else:
+            output.remove(target.format(team=team))
+
+    def callback_winner(self, old, new):
+        # A map's winner changed from old to new.
+        self._totals[old] -= 1
+        self._totals[new] += 1
+        self.draw_result()
+
+    def draw_result(self):
+        prefix = "{}/match".format(OUTPUTROOT)
+
+        for team, wins in enumerate(self.totals):
+            if not team:
+                continue  # Skip team "0" (draws).
+            target = "totalscore{}.txt".format(team)
+            output.write(prefix + target, text_fmt(wins))
+
+        # Only a clear winner has a team, if it is set in the Live tab.
+        team = self.liveteam(self.winner)
+
+        prefix += "winner"
+        logo = prefix + "logo.png"
+        color = prefix + "color.html"
+        text = prefix + "name.txt"
+        if team is not None:
+            team.draw_logo(logo, WINNERLOGOSIZE)
+            team.draw_color(color)
+            team.draw_name(text)
+        else:
+            # Either no winner, or the winning team is not set in Live tab.
+            # Skip second item as HTML cannot be removed.
+            for i in [logo, text]:
+                output.remove(i)
+            # Placeholder HTML to retain refresh rate.
+            Team.make_color(color)
+
+    def draw_positions(self):
+        for team in (1, 2):
+            target = "{}/liveposition{}.png".format(OUTPUTROOT, team)
+
+            # We are allowing positions to be set even if no current map.
+            if self.attackers:
+                if self.attackers == "Team " + str(team):
+                    pos = "attack"
+                else:
+                    pos = "defense"
+
+                assets.draw(target, "positions", pos)
+            else:
+                output.remove(target)  # Should we copy "none" in instead?
+
+    def draw_live(self):
+        self.draw_livepool()
+        self.draw_livemap()
+        self.draw_livescore()  # team=None causes all to redraw.
+        self.draw_result()
+        self.draw_positions()
+
+    def draw(self):
+        for map in self.mapset:
+            map.draw()  # Full redraw of each map.
+        self.draw_live()
+
+    def save(self):
+        self.manager.save()
+
+    def __export__(self):
+        # current=0 is the last map, init accounts for this.
+        current = self.current
+        if current is not None:
+            current = len(self.mapset) - current.index1
+        return {
+            'attackers': self.attackers,
+            'mapstyle': self.mapstyle,
+            'current': current,
+            'mapset': [i.__export__() for i in self.mapset],
+        }
+
+    def export_live(self):
+        # Current map and match results for the live state summary.
+        current = None
+        if self.current is not None:
+            current = {
+                **self.current.__export__(),
+                'index': self.current.index1,
+            }
+        return {
+            'map': current,
+            'totals': self.totals,
+            'winner': self.winner,
+        }
+
+
+class Map(Synchronisable):
+    # callback_event fires the name of a changed property, and "current" when
+    # the map becomes (or stops being) the current map.
+    pool = Property()
+    map = Property()
+    score1 = Property()
+    score2 = Property()
+    final = Property()
+
+    def __init__(self, pool="", map="", score1="0", score2="0", final=False,
+                 manager=None):
+        super().__init__()
+        self.manager = manager
+        # 1-indexed position in the map set, used in output filenames (good
+        # for non-programmers). Kept up to date by the manager (renumber).
+        self.index1 = 1
+
+        self.pool = pool
+        self.map = map
+        self.score1 = score1
+        self.score2 = score2
+        self.final = final
+
+        self._winner = self.calcwinner()  # See updatewinner().
+
+    @property
+    def iscurrent(self):
+        return self.manager.current is self
+
+    @property
+    def winner(self):
+        # Returns number of the winning team (1-indexed). 0 is draw/incomplete.
+        return self._winner
+
+    def calcwinner(self):
+        if not self.final:
+            return 0
+        team1 = 0  # Defaults.
+        team2 = 0
+        with suppress(ValueError):
+            # In case the user enters non-int.
+            team1 = int(self.score1)
+            team2 = int(self.score2)
+
+        if team1 > team2:
+            return 1
+        elif team2 > team1:
+            return 2
+        else:
+            return 0
+
+    def updatewinner(self):
+        # Update the winner after the scores or final changed, and the match
+        # results if it changed. Returns whether it changed.
+        old, self._winner = self._winner, self.calcwinner()
+        if old == self._winner:
+            return False
+        self.manager.callback_winner(old, self._winner)
+        return True
+
+    def swapteams(self):
+        # Fires events for each changed score, which redraw as necessary.
+        # `a, b = b, a` swaps values.
+        self.score1, self.score2 = self.score2, self.score1
+
+    # Property changes (callback_event) call the draw methods, which always
+    # output; draw methods of the current map also update the live outputs.
+
+    def callback_event(self, event):
+        if event == "pool":
+            self.draw_pool()
+            if self.map:
+                self.map = ""  # Not in the new pool. Fires "map".
+            else:
+                self.draw_map()  # No "map" event, but shows the pool image.
+        elif event == "map":
+            self.draw_map()
+        elif event in ("score1", "score2"):
+            self.draw_score(int(event[-1]))  # Team 1 or 2.
+            if self.updatewinner():
+                self.draw_result()
+        elif event == "final":
+            self.updatewinner()
+            self.draw_result()  # Even if no winner, shows "Draw" if final.
+            self.manager.autocurrentmap()
+        elif event == "current":
+            # Effects for non-current maps.
+            self.draw_map()
+            if POOLEFFECT:
+                self.draw_pool()
+        self.save()  # All events are data changes.
+        super().callback_event(event)
+
+    def draw_pool(self, prefix=None, image=None, text=None):
+        if prefix is None:
+            # Set prefix and overwrite image/text fragments.
+            prefix = "{}/map{}pool.".format(OUTPUTROOT, self.index1)
+            image = "png"
+            text = "txt"
+
+            if self.iscurrent:
+                # This is a standard call and we should call the live updater.
+                self.manager.draw_livepool()
+
+        if image is not None:
+            effect = POOLEFFECT if not self.iscurrent else ""
+            assets.draw(prefix + image, "modes", self.pool, effect=effect)
+
+        if text is not None:
+            output.write(prefix + text, text_fmt(self.pool))
+
+    def draw_map(self, prefix=None, image=None, text=None):
+        if prefix is None:
+            # Set prefix and overwrite image/text fragments.
+            prefix = "{}/map{}.".format(OUTPUTROOT, self.index1)
+            image = "png"
+            text = "txt"
+
+            if self.iscurrent:
+                # This is a standard call and we should call the live updater.
+                self.manager.draw_livemap()
+
+        if image is not None:
+            # Non-current maps are shown with an effect (e.g. desaturated).
+            effect = MAPEFFECT if not self.iscurrent else ""
+
+            # Map (image) name, or use the map pool.
+            map = self.map
+            if not assets.filename(map):
+                # If no map, use the pool image instead.
+                # No map and no pool? No image (places "missing.png").
+                map = "_pool " + self.pool
+
+            assets.draw(prefix + image, "maps", map, self.manager.style,
+                        placeholder=True, effect=effect)
+
+        if text is not None:
+            output.write(prefix + text, text_fmt(self.map))
+
+    def draw_score(self, team=None, target=None):
+        if team is None:
+            for team in (1, 2):
+                self.draw_score(team)  # Draw for all teams.
+            return
+
+        if target is None:
+            # Formatted target becomes a format string accepting team only.
+            target = "{}/map{}score{{team}}.txt".format(OUTPUTROOT,
+                                                        self.index1)
+
+            if self.iscurrent:
+                # Current map and standard redraw? Call the live updater too.
+                self.manager.draw_livescore(team)
+
+        # Team is 1 or 2, depending on which score value was changed.
+        target = target.format(team=team)
+        score = getattr(self, "score{}".format(team))
+        output.write(target, text_fmt(score))
+
+    def draw_result(self, prefix=None, logo=None, color=None, text=None):
+        if prefix is None:
+            prefix = "{}/map{}winner".format(OUTPUTROOT, self.index1)
+            logo = "logo.png"
+            color = "color.html"
+            text = "name.txt"
+
+        # Fetch the winning team, if one is selected in the Live tab.
+        team = self.manager.liveteam(self.winner)
+
+        if logo is not None:
+            if team is not None:
+                team.draw_logo(prefix + logo, WINNERLOGOSIZE)
+            else:
+                output.remove(prefix + logo)
+
+        if color is not None:
+            if team is not None:
+                team.draw_color(prefix + color)
+            else:
+                # Placeholder HTML to retain refresh rate.
+                Team.make_color(prefix + color)
+
+        if text is not None:
+            # If not final, write nothing (an empty file).
+            data = ""
+            if self.final:
+                if team is not None:
+                    data = team.name
+                elif self.winner != 0:
+                    # We have a winner but no team.
+                    data = "Team {}".format(self.winner)
+                else:
+                    data = "Draw"
+            output.write(prefix + text, text_fmt(data))
+
+    def draw(self):
+        # Redraws all.
+        self.draw_pool()
+        self.draw_map()
+        self.draw_score()
+        self.draw_result()
+
+    def save(self):
+        self.manager.save()
+
+    def __export__(self):
+        return {
+            'pool': self.pool,
+            'map': self.map,
+            'score1': self.score1,
+            'score2': self.score2,
+            'final': self.final,
+        }
@@ -0,0 +1,139 @@
+import inspect
+
+from ..constants import HEROROLES
+from . import assets
+
+
+# Operations on a State by the numbers used in output filenames (maps, teams
+# and players are numbered from 1), for scripts and remote control. Invalid
+# arguments raise ValueError with a message for the user. Arguments may come
+# from JSON, so their types are checked too.
+
+
+def checktype(name, value, *types):
+    # ValueError unless value is one of types. bool is a subclass of int, but
+    # True is no map number.
+    if not isinstance(value, types) or (
+            isinstance(value, bool) and bool not in types):
+        raise ValueError("Invalid {}: {!r} (must be {})".format(
+            name, value, " or ".join(i.__name__ for i in types)))
+
+
+def getmap(state, map):
+    checktype("map", map, int)
+    if not 1 <= map <= len(state.maps.mapset):
+        raise ValueError("No map {}".format(map))
+    return state.maps.mapset[map - 1]
+
+
+def getteam(state, team):
+    checktype("team", team, int)
+    if team not in (1, 2):
+        raise ValueError("No team {} (must be 1 or 2)".format(team))
+    return state.live.teamset[team - 1]
+
+
+def score(state, map, team, score):
+    getteam(state, team)  # Validate team number only.
+    checktype("score", score, int, str)
+    try:
+        score = str(int(score))
+    except ValueError:
+        raise ValueError("Invalid score: {}".format(score)) from None
+    setattr(getmap(state, map), "score{}".format(team), score)
+
+
+def final(state, map, final=True):
+    checktype("final", final, bool)
+    getmap(state, map).final = final
+
+
+def current(state, map=None):
+    # No map (None or 0) means no current map.
+    if map is not None:
+        checktype("map", map, int)
+    if map:
+        map = getmap(state, map)
+    state.maps.setcurrentmap(map or None)
+
+
+def swap(state):
+    state.live.swap()
+
+
+def team(state, team, name):
+    checktype("name", name, str)
+    try:
+        getteam(state, team).select(name)
+    except KeyError:
+        raise ValueError("No team named {!r}".format(name)) from None
+
+
+def hero(state, team, player, hero):
+    players = getteam(state, team).players
+    checktype("player", player, int)
+    checktype("hero", hero, str)
+    if not 1 <= player <= len(players):
+        raise ValueError("No player {}".format(player))
+    player = players[player - 1].player
+    if player is None:
+        raise ValueError("No player in that slot")
+    if hero and hero not in HEROROLES:
+        raise ValueError("Unknown hero: {}".format(hero))
+    player.hero = hero
+
+
+def move(state, map, position):
+    # Move map to position (e.g. move 5 1 makes map 5 the first map).
+    map = getmap(state, map)
+    checktype("position", position, int)
+    if not 1 <= position <= len(state.maps.mapset):
+        raise ValueError("No position {}".format(position))
+    state.maps.movemap(map, position)
+
+
+def custom(state, file, data):
+    checktype("file", file, str)
+    checktype("data", data, str)
+    for entry in state.custom.entries:
+        if entry.file == file:
+            entry.data = data
+            return
+    raise ValueError("No custom text file {!r}".format(file))
+
+
+def refresh(state):
+    # Rescan the images (e.g. after adding some) and redraw with them.
+    assets.refresh()
+    state.draw()
+
+
+# By name, e.g. for {"op": "score", "map": 1, "team": 2, "score": 3}.
+OPERATIONS = {
+    'score': score,
+    'final': final,
+    'current': current,
+    'move': move,
+    'swap': swap,
+    'team': team,
+    'hero': hero,
+    'custom': custom,
+    'refresh': refresh,
+}
+
+
+def apply(state, operation):
+    # Apply an operation given as a dict (e.g. from JSON), as above.
+    operation = dict(operation)
+    name = operation.pop('op', None)
+    try:
+        function = OPERATIONS[name]
+    except (KeyError, TypeError):
+        raise ValueError("Unknown operation: {}".format(name)) from None
+
+    try:
+        inspect.signature(function).bind(state, **operation)
+    except TypeError as e:
+        # Missing or unknown arguments.
+        raise ValueError("Invalid {} operation: {}".format(name, e)) from None
+    function(state, **operation)
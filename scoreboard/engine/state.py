@@ -0,0 +1,88 @@
+import json
+import os
+
+from .. import output
+from ..constants import OUTPUTROOT, SAVEFILE
+from .common import Logger, Timer
+from .custom import Custom
+from .live import Live
+from .maps import Maps
+from .teams import Teams
+
+
+class State:
+    # The root of the models, which hold all scoreboard data and produce the
+    # outputs. Models only output what their changes affect; loading draws
+    # nothing, draw() outputs everything (e.g. on startup). Widgets are views
+    # of the models, but the models also work without them (no Kivy).
+
+    def __init__(self, customdatamanager={}, teammanager={}, livemanager={},
+                 mapmanager={}, manager=None):
+        self.manager = manager  # Anything with save(), e.g. the main View.
+        self.ready = False  # Suppress saves while loading.
+        self.timer = Timer()  # Loading time, continued by the View.
+
+        # Order is important because of dependencies.
+        self.custom = Custom(**customdatamanager, manager=self)
+        self.timer.lap("custom")
+        self.teams = Teams(**teammanager, manager=self)
+        self.timer.lap("teams")
+        self.live = Live(**livemanager, manager=self)
+        self.timer.lap("live")
+        self.maps = Maps(**mapmanager, manager=self)
+        self.timer.lap("maps")
+
+        self.ready = True
+
+    @classmethod
+    def from_save(cls, file=SAVEFILE, **kwargs):
+        # Load saved state; defaults listed in the constructors.
+        state = {}
+        if os.path.isfile(file):
+            Logger.info("Scoreboard: Loading saved state...")
+            with open(file) as f:
+                try:
+                    state = json.load(f)
+                except json.decoder.JSONDecodeError:
+                    Logger.error(
+                        "Scoreboard: Failed to load JSON, defaulting...")
+
+        return cls(**state, **kwargs)
+
+    def save(self):
+        # Called by the models whenever data changes.
+        if self.ready and self.manager is not None:
+            self.manager.save()
+
+    def write(self, file=SAVEFILE):
+        # Write the save file. Returns the saved state.
+        state = self.__export__()
+        output.write(file, json.dumps(state))
+        return state
+
+    def draw_summary(self):
+        # The live state summary for overlays (which only need the live
+        # teams/map, not every team saved), output/live.json. Returns it.
+        live = self.export_live()
+        output.write(OUTPUTROOT + "/live.json", json.dumps(live))
+        return live
+
+    def draw(self):
+        self.custom.draw()
+        self.live.draw()
+        self.maps.draw()
+        self.draw_summary()  # Also drawn, so output.clean() keeps it.
+
+    def __export__(self):
+        return {
+            'livemanager': self.live.__export__(),
+            'customdatamanager': self.custom.__export__(),
+            'mapmanager': self.maps.__export__(),
+            'teammanager': self.teams.__export__(),
+        }
+
+    def export_live(self):
+        return {
+            **self.live.export_live(),
+            **self.maps.export_live(),
+        }
@@ -0,0 +1,382 @@
+from bisect import bisect_left, insort
+from functools import partial
+import json
+import os
+
+from .. import output
+from ..constants import (COLORPAGES, LOGOSIZES, OUTPUTROOT, SERVERHOST,
+                         SERVERPORT, TEAMSR)
+from . import assets, logos
+from .common import Property, Synchronisable, text_fmt
+
+
+# Colours of the colour pages by name (e.g. "team1" for output/team1color.html,
+# None if blank), which the pages follow (see COLORPAGES). Loaded from COLORS
+# first, so the command line keeps the colours it doesn't draw.
+COLORS = OUTPUTROOT + "/colors.json"
+_colors = None
+
+
+def loadcolors():
+    global _colors
+    if _colors is None:
+        try:
+            with open(COLORS, encoding='utf-8') as f:
+                _colors = dict(json.load(f))
+        except (OSError, ValueError, TypeError):
+            _colors = {}
+    return _colors
+
+
+def cleancolors():
+    # Forget the colours of pages which are no longer output (e.g. of deleted
+    # maps, also in earlier sessions), see output.release() and clean().
+    colors = loadcolors()
+    stale = [name for name in colors
+             if name + "color.html" not in output.owned(
+                 output.producer(name + "color.html"))]
+    if stale:
+        for name in stale:
+            del colors[name]
+        output.write(COLORS, json.dumps(colors, sort_keys=True))
+
+
+def parsesr(sr):
+    # A player's SR as a number, or None if it's invalid (or blank).
+    try:
+        return int(sr)
+    except (TypeError, ValueError):
+        return None
+
+
+class Teams(Synchronisable):
+    # The team database. callback_event fires "teams" when teams are added or
+    # deleted, and "teamset" when the selectable teams (self.teamlist) have
+    # changed, by deletion, addition, or renaming.
+
+    def __init__(self, teams=[], manager=None):
+        super().__init__()
+        self.manager = manager
+        self.teamset = []
+
+        # Teams by name, maintained as teams are added, renamed and deleted.
+        # Empty names are not listed. If names are duplicated, the last team
+        # (by position) takes priority in self.teamlist, the selectable teams.
+        self.teamnames = {}
+        self.teamlist = {"": None}
+
+        # Loaded silently, addteam() would notify (and save) for every team.
+        for data in teams:
+            team = Team(**data, manager=self)
+            self.teamset.append(team)
+            self.index(team)
+
+    def addteam(self, **data):
+        team = Team(**data, manager=self)
+        self.teamset.append(team)
+        self.index(team)
+        self.save()
+        self.callback_event("teams")
+        if team.name:
+            self.callback_event("teamset")
+        return team
+
+    def removeteam(self, team):
+        self.teamset.remove(team)
+        self.save()
+        self.callback_event("teams")
+        if self.unindex(team):
+            self.callback_event("teamset")
+
+    def callback_rename(self, team):
+        # Update the index, only notifying listeners if the selectable teams
+        # changed (not the case when renaming a team hidden by a duplicate).
+        changed = self.unindex(team)
+        team.indexedname = team.name
+        changed = self.index(team) or changed
+        if changed:
+            self.callback_event("teamset")
+
+    def index(self, team):
+        # Add team to the index, return whether self.teamlist changed.
+        name = team.indexedname
+        if not name:
+            return False
+
+        teams = self.teamnames.setdefault(name, [])
+        teams.append(team)
+        if len(teams) > 1:
+            # Duplicate names are rare, so this lookup is rarely needed.
+            teams.sort(key=self.teamset.index)
+        if self.teamlist.get(name) is teams[-1]:
+            return False
+        self.teamlist[name] = teams[-1]
+        return True
+
+    def unindex(self, team):
+        # Remove team from the index, return whether self.teamlist changed.
+        name = team.indexedname
+        teams = self.teamnames.get(name, [])
+        if team not in teams:
+            return False
+
+        teams.remove(team)
+        if not teams:
+            del self.teamnames[name]
+            del self.teamlist[name]
+        elif self.teamlist[name] is not teams[-1]:
+            self.teamlist[name] = teams[-1]
+        else:
+            return False
+        return True
+
+    def save(self):
+        if self.manager is not None:
+            self.manager.save()
+
+    def __export__(self):
+        return {
+            'teams': [i.__export__() for i in self.teamset],
+        }
+
+
+class Team(Synchronisable):
+    # callback_event fires the name of a changed property, or "roster".
+    name = Property()
+    logo = Property()
+    teamcolor = Property("color")
+    sr = Property()
+
+    def __init__(self, name="", logo="", teamcolor="#000000ff", sr="",
+                 roster=[], manager=None):
+        super().__init__()
+        self.manager = manager
+
+        self.name = name
+        self.logo = logo
+        self.teamcolor = teamcolor
+        self.sr = sr
+
+        # Name under which this team is listed in Teams.teamnames.
+        self.indexedname = name
+
+        # Player objects are only created when the roster is needed (it is
+        # edited, or the team is selected in the Live tab).
+        self._roster = roster
+        self._players = None
+
+        # Valid SRs of the players (sorted) and their sum, for the auto team
+        # SR. Kept up to date by the players (callback_playersr) once needed.
+        self._srs = None
+        self._srsum = 0
+        self._autosr = 0
+
+    @property
+    def players(self):
+        if self._players is None:
+            self._players = [Player(**data, team=self)
+                             for data in self._roster]
+            self._roster = None
+        return self._players
+
+    @property
+    def teamsr(self):
+        # The team SR as entered, or calculated from the roster if blank.
+        return self.sr or self.autosr
+
+    @property
+    def autosr(self):
+        # Team SR calculated from the roster (see TEAMSR), 0 if there's none.
+        if self._srs is None:
+            if self._roster is not None:
+                srs = (data.get('sr', "") for data in self._roster)
+            else:
+                srs = (player.sr for player in self.players)
+            srs = [sr for sr in map(parsesr, srs) if sr is not None]
+            self._srs = sorted(srs)
+            self._srsum = sum(srs)
+            self._autosr = self.calcsr()
+        return self._autosr
+
+    def calcsr(self):
+        srs = self._srs
+        count = len(srs)
+        if not count:
+            return 0
+        # Integer results, as SRs are entered.
+        if TEAMSR == "top6":
+            return sum(srs[-6:]) // min(6, count)
+        elif TEAMSR == "median":
+            middle = count // 2
+            if count % 2:
+                return srs[middle]
+            return (srs[middle - 1] + srs[middle]) // 2
+        elif TEAMSR == "weighted":
+            total = sum(rank * sr for rank, sr in enumerate(srs, 1))
+            return total // (count * (count + 1) // 2)  # Sum of the ranks.
+        return self._srsum // count  # "mean"
+
+    def callback_playersr(self, old, new):
+        # A player's SR changed from old to new (None if invalid), or a player
+        # was added (old is None) or removed (new is None). Fires "sr" only if
+        # the auto team SR changed, and it is used.
+        if self._srs is None:
+            return  # Not calculated yet; it will be when needed.
+        if old is not None:
+            del self._srs[bisect_left(self._srs, old)]
+            self._srsum -= old
+        if new is not None:
+            insort(self._srs, new)
+            self._srsum += new
+
+        autosr, self._autosr = self._autosr, self.calcsr()
+        if autosr != self._autosr and not self.sr:
+            self.callback_event("sr")
+
+    @staticmethod
+    def make_color(target, color=None):
+        # We don't care if the colour is invalid, not our problem.
+        name = os.path.basename(target)
+        if name.endswith("color.html"):
+            name = name[:-len("color.html")]
+        colors = loadcolors()
+        colors[name] = color
+        output.write(COLORS, json.dumps(colors, sort_keys=True))
+
+        data = ("<!DOCTYPE html>"
+                "<html>"
+                "<head>")
+        if COLORPAGES == "refresh":
+            data += "<meta http-equiv=\"refresh\" content=\"1\">"
+        data += ("<title>Solid Colour</title>"
+                 "</head>")
+        if color is not None or COLORPAGES == "push":
+            data += "<body style=\"width:100%; height:100%;"
+            if color is not None:
+                data += " background-color:{};".format(color)
+            data += "\">"
+            if COLORPAGES == "push":
+                # Follows colour changes, the page isn't reloaded.
+                data += ("<script src=\"../html/color.js\" "
+                         "data-server=\"http://{}:{}\"></script>".format(
+                             SERVERHOST, SERVERPORT))
+            data += "</body>"
+        data += "</html>"
+        output.write(target, data)
+
+    def addplayer(self, **data):
+        player = Player(**data, team=self)
+        self.players.append(player)
+        self.callback_event("roster")
+        self.callback_playersr(None, player.srvalue)
+        return player
+
+    def removeplayer(self, player):
+        self.players.remove(player)
+        self.callback_event("roster")
+        self.callback_playersr(player.srvalue, None)
+
+    def callback_event(self, event):
+        super().callback_event(event)
+        self.save()  # callback_events are for modified properties.
+
+        if event == "name":
+            # Necessary to update teamselect lists.
+            self.manager.callback_rename(self)
+
+    def draw_name(self, target):
+        output.write(target, text_fmt(self.name))
+
+    def draw_logo(self, target, size=LOGOSIZES[-1]):
+        # Target deleted if logo missing. Scaled when the copy is performed,
+        # rather than on every change of the logo field.
+        output.copyfile(partial(logos.variant, self.logo, size), target)
+
+    def draw_color(self, target):
+        self.__class__.make_color(target, self.teamcolor)
+
+    def draw_sr(self, target):
+        # text_fmt will cast to string and transform case but user should
+        # only enter numbers, so there should be no case to transform.
+        output.write(target, text_fmt(self.teamsr))
+
+    def save(self):
+        self.manager.save()
+
+    def __export__(self):
+        roster = self._roster
+        if roster is None:
+            roster = [i.__export__() for i in self.players]
+        return {
+            'name': self.name,
+            'logo': self.logo,
+            'teamcolor': self.teamcolor,
+            'sr': self.sr,
+            'roster': roster,
+        }
+
+
+class Player(Synchronisable):
+    # callback_event fires the name of a changed property.
+    battletag = Property()
+    role = Property()
+    sr = Property()
+    hero = Property()  # Used for the live tab only, but is player data.
+
+    def __init__(self, battletag="", role="Flex", sr="", hero="", team=None):
+        super().__init__()
+        self.team = team
+
+        self.battletag = battletag
+        self.role = role
+        self.sr = sr
+        self.hero = hero
+
+        self.srvalue = parsesr(sr)  # Counted in the auto team SR.
+
+    @staticmethod
+    def make_hero(target, hero, style="Portraits"):
+        if assets.filename(hero):
+            assets.draw(target, "heroes", hero, style, placeholder=True)
+        else:
+            output.remove(target)
+
+    @property
+    def user(self):
+        # Cut off the numeric part of the battletag.
+        return self.battletag.rsplit("#", 1)[0]
+
+    def callback_event(self, event):
+        super().callback_event(event)
+        self.team.save()  # callback_events are data changes.
+
+        if event == "sr":
+            old, self.srvalue = self.srvalue, parsesr(self.sr)
+            if old != self.srvalue:
+                self.team.callback_playersr(old, self.srvalue)
+
+    def draw_user(self, target, full=False):
+        data = self.battletag
+        if not full:
+            data = self.user  # Numeric part removed.
+        output.write(target, text_fmt(data))
+
+    def draw_role(self, target):
+        if assets.filename(self.role):
+            assets.draw(target, "roles", self.role, placeholder=True)
+        else:
+            output.remove(target)
+
+    def draw_sr(self, target):
+        output.write(target, text_fmt(self.sr))
+
+    def draw_hero(self, target, style="Portraits"):
+        self.__class__.make_hero(target, self.hero, style)
+
+    def __export__(self):
+        return {
+            'battletag': self.battletag,
+            'role': self.role,
+            'sr': self.sr,
+            'hero': self.hero,
+        }
@@ -1,15 +1,14 @@
-from contextlib import suppress
+from concurrent.futures import Future
 import os
-import re
-import shutil
-import unicodedata
+import threading
 
+from kivy.clock import Clock
 from kivy.lang import Builder
-from kivy.logger import Logger
 from kivy.uix.button import Button
 from kivy.uix.popup import Popup
+from kivy.uix.spinner import Spinner
 
-from .constants import IMAGEROOT
+from .constants import SAVEDELAY, SAVELATENCY
 
 
 # Load common widgets, this might be better in a common.py later.
@@ -32,61 +31,101 @@ class LoadableWidget:
         return self
 
 
-class Synchronisable:
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.listeners = []
-
-    def sync(self, listener):
-        self.listeners.append(listener)
-
-    def desync(self, listener):
-        # Get the right-index of the object in case added multiple times.
-        # This allows sync/desync to act as a stack, and maintain call order.
-        with suppress(ValueError):
-            rindex = -1 - list(reversed(self.listeners)).index(listener)
-            self.listeners.pop(rindex)
-
-    def callback_event(self, event):
-        for listener in self.listeners:
-            listener.callback_event(event)
-
-
-def filename_fmt(val):
-    val = unicodedata.normalize('NFD', val)  # Normalise, then strip others.
-    val = str(bytes(val, encoding='ascii', errors='ignore'), encoding='ascii')
-    val = val.lower()
-    # Allow letters (including underscores), spaces, dots and hyphens (dashes).
-    return re.sub(r"[^\w .-]", "", val, flags=re.ASCII)
-
-
-def text_fmt(val):
-    return str(val).upper()
-
-
-def copyfile(src, dest, delete_if_missing=True):
-    # Prevent crashes by outputting a fallback if we can't get the file.
-    try:
-        shutil.copyfile(src, dest)
-    except (FileNotFoundError, PermissionError) as e:
-        # Either delete the image or default to a "missing" image.
-        Logger.warning("Helpers: " + str(e))
-        if delete_if_missing:
-            try:
-                os.remove(dest)
-            except PermissionError:
-                Logger.error("Helpers: Could not remove " + str(dest))
-            except FileNotFoundError:
-                pass  # Can't use suppress(), must log PermissionError.
-        else:
-            try:
-                shutil.copyfile(IMAGEROOT + "/missing.png", dest)
-            except (FileNotFoundError, PermissionError) as e:
-                try:
-                    Logger.warning("Helpers: " + str(e))
-                    open(dest, 'wb').close()  # Touch target for empty file.
-                except PermissionError:
-                    Logger.error("Helpers: Could not write " + str(dest))
+class SaveScheduler:
+    # Coalesces bursts of save requests (several per keystroke) into a single
+    # call of `callback` once requests stop for `delay` seconds. A constant
+    # stream of requests still results in a call every `latency` seconds.
+    def __init__(self, callback, delay=SAVEDELAY, latency=SAVELATENCY):
+        self.callback = callback
+        self.delay = delay
+        self.latency = latency
+        self.dirtysince = None  # Clock time of the oldest unsaved request.
+        self.event = None
+
+        # Counters, mostly of interest for debugging/profiling.
+        self.requested = 0
+        self.performed = 0
+
+    @property
+    def dirty(self):
+        return self.dirtysince is not None
+
+    def request(self):
+        self.requested += 1
+        now = Clock.get_time()
+        if self.dirtysince is None:
+            self.dirtysince = now
+
+        # Restart the quiet period, but don't go past the latency deadline.
+        if self.event is not None:
+            self.event.cancel()
+        timeout = min(self.delay, self.dirtysince + self.latency - now)
+        self.event = Clock.schedule_once(self.flush, max(0, timeout))
+
+    def flush(self, *args):
+        # Called by the Clock, or directly to force any pending save (exit).
+        if self.event is not None:
+            self.event.cancel()
+            self.event = None
+
+        if self.dirty:
+            self.dirtysince = None  # Reset first, callback may request again.
+            self.performed += 1
+            self.callback()
+
+
+class MainThreadQueue:
+    # Runs work submitted from other threads (e.g. the control API) on the
+    # Kivy thread, as widgets and models must only be used from there. All
+    # items submitted before the Clock gets to them are passed to a single
+    # callback(items) call, so a burst of requests is handled in one go.
+    # items is a list of (item, future); the callback must resolve each future.
+    def __init__(self, callback):
+        self.callback = callback
+        self.lock = threading.Lock()
+        self.pending = []
+
+    def submit(self, item):
+        # Thread-safe, returns a concurrent.futures.Future.
+        future = Future()
+        with self.lock:
+            self.pending.append((item, future))
+            if len(self.pending) == 1:
+                Clock.schedule_once(self.flush)  # Thread-safe.
+        return future
+
+    def flush(self, *args):
+        with self.lock:
+            pending, self.pending = self.pending, []
+        if pending:
+            self.callback(pending)
+
+
+class LazySpinner(Spinner):
+    # A Spinner which only fetches its values (from self.source, a function)
+    # when it is opened. The dropdown has a button per value, which is costly
+    # to build for long lists that are rarely opened (teams, heroes, maps),
+    # especially on startup when every widget is created at once.
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.source = None
+        self.stale = False
+
+    def invalidate(self):
+        # The values have changed; fetch them now if open, else when opened.
+        self.stale = True
+        if self.is_open:
+            self.refresh()
+
+    def refresh(self):
+        if self.stale and self.source is not None:
+            self.values = self.source()
+            self.stale = False
+
+    def on_is_open(self, instance, value):
+        if value:
+            self.refresh()
+        super().on_is_open(instance, value)
 
 
 class DeleteWidget(Button):
@@ -0,0 +1,508 @@
+from collections import Counter, OrderedDict
+from contextlib import contextmanager, suppress
+from functools import partial, wraps
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+
+from .constants import IMAGEROOT, OUTPUTLINK, OUTPUTROOT
+from .engine.common import Logger
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Not on Windows, which has no reflinks anyway.
+
+# Digest of the last data written to each target (None if removed). Writes
+# which would not change a target are skipped, so tools watching the output
+# folder (OBS, stream decks) only reload when something actually changed.
+_digests = {}
+stats = Counter()  # "performed", "skipped", "coalesced" and "retried".
+
+# Operations held back by an open transaction, keyed by target.
+_pending = None
+_depth = 0  # Transactions may be nested, only the outermost one commits.
+
+_MISSING = object()  # Sentinel for targets without a known digest.
+
+# Manifest of the files in OUTPUTROOT made by the app, by producer: the map,
+# team or player slot an output is numbered by (e.g. "map3" for
+# output/map3pool.png), or else the file itself (e.g. "custom/caster1.txt").
+# Stale outputs are removed with release() or clean(), without listing the
+# folder.
+_PRODUCER = re.compile(r"(?:map\d+|team\d+(?:player\d+)?)(?=\D)")
+_manifest = None  # Sets of filenames (relative to OUTPUTROOT) by producer.
+_seen = set()  # Files output since starting, see clean().
+
+# The manifest is also written to MANIFEST after every change, for overlays
+# and tools to find out what changed by polling one small file:
+#     {"generation": 42, "files": {"map1.txt": {"generation": 40,
+#                                              "hash": "..."}, ...}}
+# The generation counts changes to files (across sessions), and each file has
+# the generation of its last change. Removed files are no longer listed.
+MANIFEST = OUTPUTROOT + "/manifest.json"
+_generation = 0
+_versions = {}  # Generation and digest of each file, by filename.
+_written = None  # Generation written to MANIFEST.
+
+# Callbacks by target, called with the data written to it, see watch().
+_watchers = {}
+
+# Background writer, see start(). Operations wait in _queue (by target, in
+# the order they were last replaced) until the writer thread performs them.
+# None when operations are performed by the calling thread.
+_queue = None
+_condition = threading.Condition()
+_writer = None
+_stopping = False
+_maxdepth = 0
+_latency = [0, 0.0, 0.0]  # Count, total and maximum seconds in the queue.
+
+# On Windows, a file can't be replaced or removed while another program (OBS,
+# a browser source) is reading it, which only takes a moment. Such operations
+# are tried RETRIES more times, waiting RETRYDELAY seconds, then twice as long
+# each time, before giving up.
+RETRIES = 5
+RETRYDELAY = 0.01
+
+FICLONE = 0x40049409  # Linux ioctl to clone (reflink) a file.
+_linkerrors = set()  # Reasons links failed, each only logged once.
+
+
+def _count(stat):
+    # Count in stats, which metrics() reads from another thread.
+    with _condition:
+        stats[stat] += 1
+
+
+def _unchanged(target, digest):
+    # Check (and count) whether target is already known to hold digest.
+    if _digests.get(target, _MISSING) == digest:
+        _count("skipped")
+        return True
+    _count("performed")
+    return False
+
+
+@contextmanager
+def transaction():
+    # Hold all output operations until the outermost transaction ends, then
+    # perform them back to back. Only the last operation on each target is
+    # performed, so a user action that touches a file several times (or
+    # passes through intermediate states, e.g. half-swapped teams) results in
+    # at most one write per file and no inconsistent window for overlays.
+    global _pending, _depth
+    if _depth == 0:
+        _pending = {}
+    _depth += 1
+    try:
+        yield
+    finally:
+        _depth -= 1
+        if _depth == 0:
+            pending, _pending = _pending, None
+            for key, operation in pending.items():
+                _dispatch(key, operation)
+            _dispatch(MANIFEST, _writemanifest)  # After all of them.
+
+
+def batched(func):
+    # Decorator running func inside a transaction, for event handlers.
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with transaction():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def _perform(target, operation):
+    # Run operation immediately, or queue it if a transaction is open.
+    key = os.path.normpath(target)
+    if _pending is None:
+        _dispatch(key, operation)
+        _dispatch(MANIFEST, _writemanifest)
+    else:
+        # Replaced operations move to the end, so operations are performed in
+        # the order of their last change.
+        if _pending.pop(key, None) is not None:
+            _count("coalesced")
+        _pending[key] = operation
+
+
+def _dispatch(key, operation):
+    # Hand an operation to the writer thread, if started.
+    global _maxdepth
+    if _queue is None:
+        operation()
+        return
+
+    with _condition:
+        queued = _queue.pop(key, None)
+        if queued is not None:
+            _count("coalesced")
+            since = queued[1]  # Latency of the target's oldest change.
+        else:
+            since = time.perf_counter()
+        _queue[key] = (operation, since)
+        _maxdepth = max(_maxdepth, len(_queue))
+        _condition.notify()
+
+
+def _run():
+    # The writer thread. Operations on a target are never performed out of
+    # order: there is only one writer, and one queued operation per target.
+    while True:
+        with _condition:
+            while not _queue and not _stopping:
+                _condition.wait()
+            if not _queue:
+                return  # Stopping, and everything is written.
+            key, (operation, since) = _queue.popitem(last=False)
+
+        try:
+            operation()
+        except Exception:
+            Logger.exception("Output: Failed on " + key)
+
+        with _condition:
+            latency = time.perf_counter() - since
+            _latency[0] += 1
+            _latency[1] += latency
+            _latency[2] = max(_latency[2], latency)
+
+
+def start():
+    # Perform operations in a background thread, so slow disks (e.g. the
+    # output folder on a network share) don't block the caller. Operations
+    # must still be made from one thread (the transactions aren't shared).
+    global _queue, _writer, _stopping
+    if _writer is not None:
+        return
+    _queue = OrderedDict()
+    _stopping = False
+    _writer = threading.Thread(target=_run, name="output", daemon=True)
+    _writer.start()
+
+
+def stop():
+    # Perform the queued operations, then go back to performing them in the
+    # calling thread.
+    global _queue, _writer, _stopping
+    if _writer is None:
+        return
+    with _condition:
+        _stopping = True
+        _condition.notify_all()
+    _writer.join()
+    _queue = _writer = None
+
+
+def metrics():
+    # Statistics of the output operations and the writer queue, e.g. for
+    # checking a slow output folder keeps up. Latencies are in milliseconds.
+    with _condition:
+        count, total, maximum = _latency
+        return {
+            **stats,
+            'depth': len(_queue or ()),
+            'maxdepth': _maxdepth,
+            'latency': {
+                'mean': round(total / max(1, count) * 1000, 1),
+                'max': round(maximum * 1000, 1),
+            },
+        }
+
+
+def _retry(function, *args):
+    # Call function, retrying as above on PermissionError.
+    for attempt in range(RETRIES):
+        try:
+            return function(*args)
+        except PermissionError:
+            _count("retried")
+            time.sleep(RETRYDELAY * 2 ** attempt)
+    return function(*args)  # The last try raises.
+
+
+def _replace(target, fill):
+    # Write to a temporary file next to target, then rename it over target.
+    # The rename is atomic, so readers polling the file (browser sources, OBS)
+    # see either the old or the new contents, never a partial write.
+    temp = target + ".tmp"
+    try:
+        with open(temp, 'wb') as f:
+            fill(f)
+        _retry(os.replace, temp, target)
+    except BaseException:
+        with suppress(FileNotFoundError):
+            os.remove(temp)
+        raise
+
+
+def write(target, data):
+    _own(target, True)
+    _perform(target, partial(_write, target, data))
+
+
+def remove(target):
+    _own(target, False)
+    _perform(target, partial(_remove, target))
+
+
+def copyfile(src, dest, delete_if_missing=True):
+    # src may be a function returning the path, called when the copy is
+    # performed (in the writer thread if started), e.g. to scale an image.
+    _own(dest, True)  # Even if removed, it may be later (it's owned).
+    _perform(dest, partial(_copyfile, src, dest, delete_if_missing))
+
+
+def watch(target, callback):
+    # Call callback(data) whenever data is written to target (possibly in the
+    # writer thread), e.g. to push it to overlays.
+    _watchers[os.path.normpath(target)] = callback
+
+
+def _loadmanifest():
+    global _manifest, _generation
+    if _manifest is not None:
+        return _manifest
+
+    _manifest = {}
+    present = _listdir(OUTPUTROOT)
+    present += ["custom/" + name for name in _listdir(OUTPUTROOT + "/custom")]
+    try:
+        with open(MANIFEST, encoding='utf-8') as f:
+            data = json.load(f)
+        generation = int(data['generation'])
+        versions = {name: (int(version['generation']), version['hash'])
+                    for name, version in data['files'].items()}
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        # No (valid) manifest, e.g. from an older version: the outputs are
+        # known by their names (custom files are all ours).
+        files = [name for name in present
+                 if _PRODUCER.match(name) or name.startswith("custom/")]
+    else:
+        _generation = generation  # Nothing was performed yet.
+        _versions.update(versions)
+        files = list(versions)
+
+        # The hashes are those of the files as we left them, so unchanged
+        # outputs aren't written again (e.g. by every command line call).
+        # Files removed since then are written regardless.
+        for name in set(files).intersection(present):
+            key = os.path.normpath("{}/{}".format(OUTPUTROOT, name))
+            _digests.setdefault(key, versions[name][1])
+
+    for name in files:
+        _manifest.setdefault(producer(name), set()).add(name)
+    return _manifest
+
+
+def _listdir(folder):
+    with suppress(FileNotFoundError, NotADirectoryError):
+        return [entry.name for entry in os.scandir(folder) if entry.is_file()]
+    return []
+
+
+def producer(name):
+    # Producer of a file, by its name relative to OUTPUTROOT.
+    match = _PRODUCER.match(name)
+    return match[0] if match else name
+
+
+def _name(target):
+    # Filename relative to OUTPUTROOT, or None if not an output.
+    name = os.path.relpath(target, OUTPUTROOT).replace(os.sep, "/")
+    if name.startswith("../") or name == "manifest.json":
+        return None
+    return name
+
+
+def _own(target, owned):
+    # Add or remove a target in the manifest (if it's in OUTPUTROOT).
+    name = _name(target)
+    if name is None:
+        return
+
+    _seen.add(name)
+    manifest = _loadmanifest()
+    files = manifest.get(producer(name))
+    if owned and files is None:
+        files = manifest[producer(name)] = set()
+    elif files is None:
+        return
+
+    if owned:
+        files.add(name)
+    else:
+        files.discard(name)
+        if not files:
+            del manifest[producer(name)]
+
+
+def owned(producer):
+    # Files of a producer, relative to OUTPUTROOT.
+    return set(_loadmanifest().get(producer, ()))
+
+
+def release(producer):
+    # Remove all files of a producer, e.g. a deleted map.
+    for name in owned(producer):
+        remove("{}/{}".format(OUTPUTROOT, name))
+
+
+def clean():
+    # Remove the files of the manifest that haven't been output since
+    # starting, i.e. stale files of earlier sessions. Call once, after
+    # everything was drawn.
+    for files in list(_loadmanifest().values()):
+        for name in files - _seen:
+            remove("{}/{}".format(OUTPUTROOT, name))
+
+
+def _changed(key, digest):
+    # Record a performed operation in the manifest.
+    global _generation
+    name = _name(key)
+    if name is not None:
+        _generation += 1
+        if digest is None:
+            _versions.pop(name, None)
+        else:
+            _versions[name] = (_generation, digest)
+
+
+def _writemanifest():
+    global _written
+    if _manifest is None or _written == _generation:
+        return  # Not loaded (no outputs yet), or up to date.
+    files = {name: {'generation': generation, 'hash': digest}
+             for name, (generation, digest) in sorted(_versions.items())}
+    _write(MANIFEST, json.dumps({'generation': _generation, 'files': files}))
+    _written = _generation
+
+
+def _write(target, data):
+    # Text is written as UTF-8; bytes are written as-is.
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+
+    key = os.path.normpath(target)
+    digest = hashlib.sha1(data).hexdigest()
+    if _unchanged(key, digest):
+        return
+
+    try:
+        _replace(target, lambda f: f.write(data))
+    except PermissionError:
+        _digests.pop(key, None)  # State unknown, don't skip the next write.
+        Logger.error("Output: Could not write " + str(target))
+    else:
+        _digests[key] = digest
+        _changed(key, digest)
+        if key in _watchers:
+            _watchers[key](data)
+
+
+def _remove(target):
+    key = os.path.normpath(target)
+    if _unchanged(key, None):
+        return
+
+    try:
+        _retry(os.remove, target)
+    except PermissionError:
+        _digests.pop(key, None)
+        Logger.error("Output: Could not remove " + str(target))
+        return
+    except FileNotFoundError:
+        # Already gone: only a change if the manifest still lists it.
+        _digests[key] = None
+        if _name(key) in _versions:
+            _changed(key, None)
+        return
+    _digests[key] = None
+    _changed(key, None)
+
+
+def _copy(src, dest):
+    # A copy is identified by the source file and its metadata, which avoids
+    # reading (and hashing) the source just to find out nothing has changed.
+    stat = os.stat(src)
+    key = os.path.normpath(dest)
+    digest = "{}:{}:{}".format(os.path.abspath(src),
+                               stat.st_mtime_ns, stat.st_size)
+    digest = hashlib.sha1(digest.encode('utf-8')).hexdigest()
+    if _unchanged(key, digest):
+        return
+
+    _digests.pop(key, None)  # Only restored once the copy succeeds.
+    if not _link(src, dest):
+        with open(src, 'rb') as infile:
+            _replace(dest, lambda f: shutil.copyfileobj(infile, f))
+    _digests[key] = digest
+    _changed(key, digest)
+
+
+def _reflink(src, dest):
+    if fcntl is None:
+        raise OSError("Reflinks are not supported on this system")
+    with open(src, 'rb') as infile, open(dest, 'wb') as f:
+        fcntl.ioctl(f.fileno(), FICLONE, infile.fileno())
+
+
+LINKS = {
+    'hardlink': os.link,
+    'symlink': lambda src, dest: os.symlink(os.path.abspath(src), dest),
+    'reflink': _reflink,
+}
+
+
+def _link(src, dest):
+    # Replace dest with a link to src as set by OUTPUTLINK, which is atomic
+    # like _replace(). Returns False if it should be copied instead.
+    if OUTPUTLINK not in LINKS:
+        return False
+
+    temp = dest + ".tmp"
+    try:
+        with suppress(FileNotFoundError):
+            os.remove(temp)  # Links can't overwrite a leftover.
+        LINKS[OUTPUTLINK](src, temp)
+        os.replace(temp, dest)
+        # Renaming over a hardlink to the same file does nothing.
+        with suppress(FileNotFoundError):
+            os.remove(temp)
+    except OSError as e:
+        with suppress(FileNotFoundError):
+            os.remove(temp)
+        reason = e.strerror or str(e)
+        if reason not in _linkerrors:
+            _linkerrors.add(reason)
+            Logger.info("Output: Can't {} ({}), copying instead".format(
+                OUTPUTLINK, reason))
+        return False
+    return True
+
+
+def _copyfile(src, dest, delete_if_missing):
+    # Prevent crashes by outputting a fallback if we can't get the file.
+    if callable(src):
+        src = src()
+    try:
+        _copy(src, dest)
+    except (FileNotFoundError, IsADirectoryError, PermissionError) as e:
+        # Either delete the image or default to a "missing" image.
+        Logger.warning("Output: " + str(e))
+        if delete_if_missing:
+            _remove(dest)
+        else:
+            try:
+                _copy(IMAGEROOT + "/missing.png", dest)
+            except (FileNotFoundError, PermissionError) as e:
+                Logger.warning("Output: " + str(e))
+                _write(dest, b"")  # Empty file as a last resort.
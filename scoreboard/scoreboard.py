@@ -2,13 +2,19 @@ import json
 import os
 
 import kivy.app
+from kivy.clock import Clock
 from kivy.core.window import Window
 from kivy.lang import Builder
 from kivy.logger import Logger
 from kivy.uix.popup import Popup
 from kivy.uix.tabbedpanel import TabbedPanel
 
-from .constants import OUTPUTROOT, SAVEFILE
+from . import output, server
+from .constants import OUTPUTROOT
+from .engine import assets, operations
+from .engine.state import State
+from .engine.teams import COLORS, cleancolors
+from .helpers import MainThreadQueue, SaveScheduler
 # Load kv and classes below.
 from .components.live import LiveManager
 from .components.maps import MapManager
@@ -33,52 +39,79 @@ class View(TabbedPanel):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.ready = False  # Whether or not we can access all elements etc.
+        self.savescheduler = SaveScheduler(self.write)
+        self.publishtrigger = Clock.create_trigger(self.publish)  # Per frame.
+        self.controlqueue = MainThreadQueue(self.control)  # Control API.
 
     @classmethod
     def from_save(cls):
         self = cls()
 
-        # Load saved state; defaults listed below as well.
-        state = {}
-        if os.path.isfile(SAVEFILE):
-            Logger.info("Scoreboard: Loading saved state...")
-            with open(SAVEFILE) as f:
-                try:
-                    state = json.load(f)
-                except json.decoder.JSONDecodeError:
-                    Logger.error(
-                        "Scoreboard: Failed to load JSON, defaulting...")
-
-        # Order is important because of dependencies.
-        self.customdatamanager = CustomDataManager.from_factory(
-            **state.get('customdatamanager', {}),
-            parent=self.tabcustom, manager=self)
-        self.teammanager = TeamManager.from_factory(
-            **state.get('teammanager', {}),
-            parent=self.tabteams, manager=self)
-        self.livemanager = LiveManager.from_factory(
-            **state.get('livemanager', {}),
-            parent=self.tablive, manager=self)
-        self.mapmanager = MapManager.from_factory(
-            **state.get('mapmanager', {}),
-            parent=self.tabmaps, manager=self)
+        # All data is held by the models, the tabs are views of them. Loading
+        # outputs nothing and views don't change the models, so everything is
+        # drawn once at the end, and written in one go.
+        with output.transaction():
+            self.state = State.from_save(manager=self)
+            timer = self.state.timer
+            # Map effects in the background, those of the current style
+            # first, while the tabs are made (and for later switches).
+            assets.prewarm(self.state.maps.mapstyle)
+            self.customdatamanager = CustomDataManager.from_factory(
+                model=self.state.custom, parent=self.tabcustom, manager=self)
+            timer.lap("custom tab")
+            self.teammanager = TeamManager.from_factory(
+                teams=self.state.teams, parent=self.tabteams, manager=self)
+            timer.lap("teams tab")
+            self.livemanager = LiveManager.from_factory(
+                model=self.state.live, parent=self.tablive, manager=self)
+            timer.lap("live tab")
+            self.mapmanager = MapManager.from_factory(
+                model=self.state.maps, parent=self.tabmaps, manager=self)
+            timer.lap("maps tab")
+            self.state.draw()
+            output.clean()  # Outputs of earlier sessions not drawn now.
+            cleancolors()
+            timer.lap("draw")
+        timer.lap("output")
+        Logger.info("Scoreboard: Loaded in {}".format(timer))
 
         self.ready = True
 
         return self
 
     def save(self):
+        # Mark state as dirty: overlays are updated on the next frame, while
+        # the scheduler writes the save file out once things settle.
         if self.ready:
-            with open(SAVEFILE, 'w') as f:
-                json.dump(self.__export__(), f)
+            self.publishtrigger()
+            self.savescheduler.request()
 
-    def __export__(self):
-        return {
-            'livemanager': self.livemanager.__export__(),
-            'customdatamanager': self.customdatamanager.__export__(),
-            'mapmanager': self.mapmanager.__export__(),
-            'teammanager': self.teammanager.__export__(),
-        }
+    def publish(self, *args):
+        # Push changes to overlays, served and polling (output/live.json).
+        if self.ready:
+            server.publish("save", self.state.__export__())
+            server.publish("live", self.state.draw_summary())
+
+    def write(self):
+        if self.ready:
+            self.state.write()
+
+    @output.batched
+    def control(self, requests):
+        # Requests of the control API, applied to the models (the views follow
+        # their events). All requests since the last frame share one output
+        # transaction and one save.
+        for request, future in requests:
+            try:
+                for operation in request:
+                    operations.apply(self.state, operation)
+            except ValueError as e:
+                future.set_exception(e)  # Invalid request.
+            except Exception as e:
+                Logger.exception("Scoreboard: Control request failed")
+                future.set_exception(e)
+            else:
+                future.set_result(None)
 
 
 class ExitDialog(Popup):
@@ -90,7 +123,18 @@ class ExitDialog(Popup):
 # Previously Scoreboard, but kivy autoloads <classname>.kv which is undesired.
 class App(kivy.app.App):
     def build(self):
-        return View.from_save()
+        output.start()  # Write outputs in the background.
+        # Colours are pushed to the colour pages as soon as they are written.
+        output.watch(COLORS, lambda data: server.publish(
+            "colors", json.loads(data.decode('utf-8'))))
+        view = View.from_save()
+        view.publish()  # Initial state for overlays.
+        server.start(control=view.controlqueue.submit)
+        return view
+
+    def on_stop(self):
+        server.stop()
+        output.stop()  # Finish writing.
 
 
 if __name__ == '__main__':
@@ -118,3 +162,9 @@ if __name__ == '__main__':
     s = App()
     s.run()
     s.root.save()  # Until we have a save event bubble up.
+    s.root.publish()  # Now, the Clock has stopped.
+    s.root.savescheduler.flush()
+    Logger.info("Scoreboard: Saves requested {}, performed {}".format(
+        s.root.savescheduler.requested, s.root.savescheduler.performed))
+    Logger.info("Scoreboard: Outputs performed {}, skipped {}".format(
+        output.stats["performed"], output.stats["skipped"]))
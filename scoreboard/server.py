@@ -0,0 +1,227 @@
+from concurrent.futures import TimeoutError
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+import json
+import queue
+import socket
+import socketserver
+import threading
+
+from . import output
+from .constants import SERVERHOST, SERVERPORT
+from .engine.common import Logger, formatstats
+
+KEEPALIVE = 15  # Seconds between comments sent to idle event streams.
+CONTROLTIMEOUT = 5  # Seconds to wait for the program to apply operations.
+READTIMEOUT = 10  # Seconds to wait for clients sending (or reading) data.
+MAXREQUEST = 1 << 20  # Largest control API request, in bytes.
+
+# Each named state ("save", "live", "colors") is published to /events/<name>.
+# The colour pages are local files, so "colors" may be read by other origins.
+PUBLIC = {"colors"}
+_lock = threading.Lock()
+_states = {}  # Last published states, sent in full to new subscribers.
+_clients = {}  # Sets of queues of (event, data) tuples, one per open stream.
+_server = None
+
+# Applies a list of operations (dicts, see engine/operations.py) in the
+# program, returning a concurrent.futures.Future; set by start().
+_control = None
+
+
+def diff(old, new):
+    # Return a JSON merge patch (RFC 7386) turning old into new, or None if
+    # they are equal. Removed keys are null; lists are replaced wholesale.
+    if old == new:
+        return None
+    if not isinstance(old, dict) or not isinstance(new, dict):
+        return new
+
+    patch = {key: None for key in old if key not in new}
+    for key, value in new.items():
+        if key not in old:
+            patch[key] = value
+        elif old[key] != value:
+            patch[key] = diff(old[key], value)
+    return patch
+
+
+def publish(name, state):
+    # Called with the state whenever it is saved; pushes only what changed.
+    with _lock:
+        patch = diff(_states.get(name), state)
+        _states[name] = state
+        if patch is None:
+            return
+        data = json.dumps(patch)
+        for client in _clients.get(name, ()):
+            client.put(("patch", data))
+
+
+def subscribe(name):
+    client = queue.Queue()
+    with _lock:
+        if name in _states:
+            client.put(("state", json.dumps(_states[name])))
+        _clients.setdefault(name, set()).add(client)
+    return client
+
+
+def unsubscribe(name, client):
+    with _lock:
+        _clients[name].discard(client)
+
+
+class RequestHandler(SimpleHTTPRequestHandler):
+    # Serves files from the working directory (html/, output/, save.json...),
+    # plus Server-Sent Events streams of state changes at /events/<name>.
+    timeout = READTIMEOUT  # Of the socket, so slow clients can't hang on.
+
+    def local(self):
+        # Whether the request is addressed to us by name, rather than by a
+        # web page whose domain was made to resolve to 127.0.0.1 (DNS
+        # rebinding), which browsers would treat as the same origin.
+        port = self.server.server_address[1]
+        hosts = {"{}:{}".format(host, port)
+                 for host in ("127.0.0.1", "localhost", SERVERHOST)}
+        if self.headers.get("Host", "").lower() in hosts:
+            return True
+        self.send_json(403, {'error': "Unexpected Host"})
+        return False
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path.startswith("/api") and not self.local():
+            return
+        if path.startswith("/events/"):
+            self.stream_events(path[len("/events/"):])
+        elif path == "/api/output":
+            self.send_json(200, {**output.metrics(),
+                                 'formats': formatstats()})
+        else:
+            super().do_GET()
+
+    def do_POST(self):
+        path = self.path.split("?", 1)[0]
+        if path.startswith("/api") and not self.local():
+            return
+        if path == "/api":
+            self.control()
+        else:
+            self.send_error(404)
+
+    def send_json(self, code, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def control(self):
+        # The control API: an operation, or a list of operations applied
+        # together, as JSON. E.g. {"op": "score", "map": 1, "team": 2,
+        # "score": 3}. Operations before an invalid one stay applied.
+        if _control is None:
+            self.send_json(503, {'error': "Not ready"})
+            return
+
+        # Browsers can't send JSON to another site without asking first (a
+        # CORS preflight, which we don't answer), so web pages can't use this.
+        if self.headers.get_content_type() != "application/json":
+            self.send_json(415, {'error': "Content-Type must be JSON"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.send_json(400, {'error': "Invalid Content-Length"})
+            return
+        if length > MAXREQUEST:
+            self.send_json(413, {'error': "Request too large"})
+            self.close_connection = True  # Rather than reading the body.
+            return
+
+        try:
+            operations = json.loads(self.rfile.read(length).decode('utf-8'))
+        except ValueError:  # Includes JSON and Unicode decoding errors.
+            self.send_json(400, {'error': "Invalid JSON"})
+            return
+        except socket.timeout:
+            self.send_json(408, {'error': "Timed out reading the request"})
+            self.close_connection = True
+            return
+        if isinstance(operations, dict):
+            operations = [operations]
+        if (not isinstance(operations, list) or
+                not all(isinstance(i, dict) for i in operations)):
+            self.send_json(400, {'error': "Expected operation objects"})
+            return
+
+        try:
+            _control(operations).result(timeout=CONTROLTIMEOUT)
+        except ValueError as e:
+            self.send_json(400, {'error': str(e)})
+        except TimeoutError:
+            self.send_json(504, {'error': "Timed out"})
+        except Exception as e:
+            self.send_json(500, {'error': str(e)})
+        else:
+            self.send_json(200, {'ok': True})
+
+    def stream_events(self, name):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        if name in PUBLIC:
+            self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+
+        client = subscribe(name)
+        try:
+            while True:
+                try:
+                    event, data = client.get(timeout=KEEPALIVE)
+                    message = "event: {}\ndata: {}\n\n".format(event, data)
+                except queue.Empty:
+                    message = ": keepalive\n\n"  # Detects closed streams.
+                self.wfile.write(message.encode('utf-8'))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError,
+                ConnectionAbortedError, socket.timeout):
+            pass  # Browser source closed, reloaded or stuck.
+        finally:
+            unsubscribe(name, client)
+
+    def log_message(self, format, *args):
+        Logger.debug("Server: " + format % args)
+
+
+class Server(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True  # Open event streams must not block exit.
+
+
+def start(host=SERVERHOST, port=SERVERPORT, control=None):
+    global _server, _control
+    _control = control
+    try:
+        _server = Server((host, port), RequestHandler)
+    except OSError as e:
+        # Overlays opened as files still work, they fall back to polling.
+        Logger.error("Server: Could not listen on port {}: {}".format(port, e))
+        return
+
+    thread = threading.Thread(target=_server.serve_forever, daemon=True)
+    thread.start()
+    Logger.info("Server: Serving overlays at http://{}:{}/html/".format(
+        host, port))
+
+
+def stop():
+    global _server, _control
+    _control = None
+    if _server is not None:
+        _server.shutdown()
+        _server.server_close()
+        _server = None